@@ -19,7 +19,12 @@ game.authreq()
 game.getCannons()
 
 while game.getTurn():
-    game.shot()
+    print(f'turn {game.turn}: states in {game.turn_times[-1]*1000:.1f} ms')
+    over = not game.shot()
     game.turn += 1
+    if over:
+        break
 
-game.quit()
\ No newline at end of file
+game.quit()
+if game.turn_times:
+    print(f'{len(game.turn_times)} turns, mean turn fetch {sum(game.turn_times)/len(game.turn_times)*1000:.1f} ms')
\ No newline at end of file
@@ -0,0 +1,151 @@
+import argparse
+import queue
+import socket
+import struct
+import sys
+import threading
+import time
+
+from auth.messager import *
+
+# Streaming bulk validation of SAS (id:nonce:token) and GAS (sas+sas+...+token) strings
+WORKERS = 16
+ERROR_TYPE = 256
+DONE = None
+
+def buildRequest(validators, text):
+    # a GAS has at least one '+', anything else is validated as a SAS
+    if '+' in text:
+        return validators['gtv'].request([text.count('+'), text])
+    return validators['itv'].request([text])
+
+class ValidationWorker(threading.Thread):
+    # owns one TCP connection and reuses it for every token it validates
+    def __init__(self, host, port, jobs, results):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port
+        self.jobs = jobs
+        self.results = results
+        self.validators = {'itv': messager('itv'), 'gtv': messager('gtv')}
+        self.sock = None
+
+    def connect(self):
+        family = socket.AF_INET if determineIpType(self.host) == socket.AF_INET else socket.AF_INET6
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(10)
+        self.sock.connect((self.host, self.port))
+
+    def recvAll(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('connection closed by the server')
+            data += chunk
+        return data
+
+    def exchange(self, packet):
+        # validation responses echo the request and append a 1 byte status
+        if self.sock is None:
+            self.connect()
+        self.sock.sendall(packet)
+        header = self.recvAll(4)
+        type, code = struct.unpack('>HH', header)
+        if type == ERROR_TYPE:
+            # the server may drop the connection after an error
+            self.close()
+            raise RequestError(code)
+        return (header + self.recvAll(len(packet) - 3))[-1]
+
+    def validate(self, text):
+        try:
+            packet = buildRequest(self.validators, text)
+        except (ValueError, struct.error) as e:
+            return f'error: {e}'
+        for attempt in range(2):
+            try:
+                status = self.exchange(packet)
+                return 'valid' if status == 0 else 'invalid'
+            except RequestError as e:
+                return f'error: {e.message}'
+            except (OSError, ConnectionError) as e:
+                # reconnect once, the server may have closed an idle connection
+                self.close()
+                error = e
+        return f'error: {error}'
+
+    def run(self):
+        # DONE goes out even if the worker dies, bulkValidate waits for one from every worker
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is DONE:
+                    return
+                lineno, text = job
+                self.results.put((lineno, text, self.validate(text)))
+        finally:
+            self.close()
+            self.results.put(DONE)
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+        self.sock = None
+
+def readTokens(stream, jobs, workers, failures):
+    # a binary stream is decoded here: bytes that are not UTF-8 only spoil their own line
+    try:
+        for lineno, line in enumerate(stream, 1):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', errors='replace')
+            text = line.strip()
+            if text:
+                jobs.put((lineno, text))
+    except Exception as e:
+        failures.append(e)
+    finally:
+        for i in range(workers):
+            jobs.put(DONE)
+
+def bulkValidate(host, port, stream, out, workers=WORKERS):
+    # queues are bounded so memory does not grow with the input size
+    jobs = queue.Queue(maxsize=workers * 4)
+    results = queue.Queue(maxsize=workers * 4)
+    pool = [ValidationWorker(host, port, jobs, results) for i in range(workers)]
+    for worker in pool:
+        worker.start()
+    failures = []
+    threading.Thread(target=readTokens, args=(stream, jobs, workers, failures), daemon=True).start()
+
+    counts = {'valid': 0, 'invalid': 0, 'error': 0}
+    running = workers
+    while running:
+        result = results.get()
+        if result is DONE:
+            running -= 1
+            continue
+        lineno, text, status = result
+        counts[status.split(':')[0]] += 1
+        out.write(f'{lineno}\t{status}\t{text}\n')
+    out.flush()
+    if failures:
+        raise failures[0]
+    return counts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Validate SAS/GAS tokens in bulk, one per line')
+    parser.add_argument('host')
+    parser.add_argument('port', type=int)
+    parser.add_argument('input', nargs='?', default='-', help='token file, - for stdin')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    stream = sys.stdin.buffer if args.input == '-' else open(args.input, 'rb')
+    with stream:
+        counts = bulkValidate(args.host, args.port, stream, sys.stdout, args.workers)
+    elapsed = time.monotonic() - started
+    total = sum(counts.values())
+    print(f'{total} tokens in {elapsed:.3f}s ({total / elapsed:.1f}/s): ' +
+          ', '.join(f'{n} {k}' for k, n in counts.items()), file=sys.stderr)
@@ -13,7 +13,7 @@ def auth(host, port, command):
         messager_o = messager(type=type)
     except Exception as e:
         return e
-    if determineIpType(host) == 'ipv4':
+    if determineIpType(host) == socket.AF_INET:
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM) # create a socket with IPv4 address family
     else:
         sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM) # create a socket with IPv6 address family
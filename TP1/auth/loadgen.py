@@ -0,0 +1,100 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from auth.client import auth
+from auth.messager import RequestError, messager
+from auth.server import serve
+from auth.udp import UDPEngine
+
+def fetchTokens(host, port, commands, concurrency=32):
+    # answers of the commands over UDP, in order; tokens for the validation workloads
+    messagers = [messager(c[0]) for c in commands]
+    packets = [m.request(c[1:]) for m, c in zip(messagers, commands)]
+    tokens = [None] * len(commands)
+    engine = UDPEngine(host, port, window=concurrency)
+    try:
+        for request in engine.run(packets):
+            if request.response is None:
+                if request.error is not None or request.suspect is not None:
+                    raise RequestError(request.error or request.suspect)
+                raise TimeoutError(f'no answer to {commands[request.index][0]}')
+            tokens[request.index] = messagers[request.index].response(request.response)
+    finally:
+        engine.close()
+    return tokens
+
+def makeCommands(host, port, command, count):
+    # build `count` distinct commands of one type, identical packets would be answered together;
+    # validations use a pool of distinct tokens fetched up front
+    itr = [['itr', f'{i:012d}', i] for i in range(count)]
+    if command == 'itr':
+        return itr
+    sas = fetchTokens(host, port, itr)
+    if command == 'itv':
+        return [['itv', s] for s in sas]
+    gtr = [['gtr', 2, sas[i], sas[(i + 1) % count]] for i in range(count)]
+    if command == 'gtr':
+        return gtr
+    return [['gtv', 2, gas] for gas in fetchTokens(host, port, gtr)]
+
+def timedAuth(host, port, command):
+    # an error reply or a dropped connection is a failed request, not the end of the run
+    started = time.monotonic()
+    try:
+        result = auth(host, port, command)
+    except (RequestError, OSError) as e:
+        result = e
+    return time.monotonic() - started, result
+
+def runTCP(host, port, commands, concurrency):
+    latencies, failures = [], 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for latency, result in executor.map(lambda c: timedAuth(host, port, c), commands):
+            if result is None or isinstance(result, Exception):
+                failures += 1
+            latencies.append(latency)
+    return latencies, failures
+
+def runUDP(host, port, commands, concurrency):
+    latencies, failures = [], 0
+    engine = UDPEngine(host, port, window=concurrency)
+    try:
+        packets = (messager(c[0]).request(c[1:]) for c in commands)
+        for request in engine.run(packets):
+            if request.response is None:
+                failures += 1
+            latencies.append(request.latency)
+    finally:
+        engine.close()
+    return latencies, failures
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+def report(transport, command, latencies, failures, elapsed):
+    latencies.sort()
+    print(f'{transport} {command}: {len(latencies)} requests, {failures} failures in {elapsed:.3f}s')
+    print(f'  {len(latencies) / elapsed:.1f} requests/s')
+    print('  latency ms: ' + ' '.join(f'p{p}={percentile(latencies, p) * 1000:.2f}' for p in (50, 90, 99, 100)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load generator for the auth clients')
+    parser.add_argument('host', nargs='?', default='127.0.0.1')
+    parser.add_argument('port', nargs='?', type=int, default=0)
+    parser.add_argument('--local', action='store_true', help='start a local auth server on an ephemeral port')
+    parser.add_argument('--transport', choices=['tcp', 'udp'], default='udp')
+    parser.add_argument('--command', choices=['itr', 'itv', 'gtr', 'gtv'], default='itr')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+
+    host, port = args.host, args.port
+    if args.local:
+        tcp, udp = serve(host)
+        port = tcp.server_address[1]
+    commands = makeCommands(host, port, args.command, args.requests)
+    run = runTCP if args.transport == 'tcp' else runUDP
+    started = time.monotonic()
+    latencies, failures = run(host, port, commands, args.concurrency)
+    report(args.transport, args.command, latencies, failures, time.monotonic() - started)
@@ -39,7 +39,7 @@ class messager:
         if len(response) != 4:
             return response
         error_MSG_format = '>HH'
-        error_code, error_length = struct.unpack(error_MSG_format, response)
+        error_type, error_code = struct.unpack(error_MSG_format, response)
         raise RequestError(error_code)
     
     def parseSAS(self, sas):
@@ -81,7 +81,7 @@ class messager:
         # individual token validation - Response
         packet_format = '>2s 12s I 64s 1s'
         vals = struct.unpack(packet_format, response)
-        status = int(vals[-1].decode() == b'\x01')
+        status = vals[-1][0]
         return status
     
     def gtr_request(self, params):
@@ -127,7 +127,7 @@ class messager:
         # group token validation - Response
         packet_format = self.packet_format + '1s'
         vals = struct.unpack(packet_format, response)
-        status = int(vals[-1].decode() == b'\x01')
+        status = vals[-1][0]
         return status
     
 def determineIpType(hostname):
@@ -0,0 +1,168 @@
+import argparse
+import hashlib
+import socketserver
+import struct
+import threading
+
+from auth.messager import ERROR_MSGS
+
+# Local stand-in for the course auth server: itr/itv/gtr/gtv over TCP and UDP
+SECRET = 'tp-redes'
+SAS_SIZE = 80  # 12s id + I nonce + 64s token
+TOKEN_SIZE = 64
+ERROR_TYPE = 256
+
+INVALID_MSG_CODE = 1
+INVALID_MSG_LENGTH = 2
+INVALID_PARAMETER = 3
+INVALID_SINGLE_TOKEN = 4
+ASCII_DECODE_ERROR = 5
+
+class ProtocolError(Exception):
+    def __init__(self, code):
+        self.code = code
+        super().__init__(ERROR_MSGS[code])
+
+class AuthLogic:
+    # deterministic token generation: the same request always gets the same token
+    def __init__(self, secret=SECRET):
+        self.secret = bytes(secret, encoding='ascii')
+
+    def token(self, *parts):
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part)
+        digest.update(self.secret)
+        return bytes(digest.hexdigest(), encoding='ascii')
+
+    def checkAscii(self, *fields):
+        try:
+            for field in fields:
+                field.decode('ascii')
+        except UnicodeDecodeError:
+            raise ProtocolError(ASCII_DECODE_ERROR)
+
+    def sasToken(self, sas):
+        # expected token for a packed SAS (id and nonce are the first 16 bytes)
+        return self.token(sas[:16])
+
+    def validSAS(self, sas):
+        self.checkAscii(sas[:12], sas[16:])
+        return sas[16:] == self.sasToken(sas)
+
+    def groupCount(self, packet, extra):
+        if len(packet) < 4:
+            raise ProtocolError(INVALID_MSG_LENGTH)
+        N, = struct.unpack('>H', packet[2:4])
+        if len(packet) != 4 + N * SAS_SIZE + extra:
+            raise ProtocolError(INVALID_MSG_LENGTH)
+        if N == 0:
+            raise ProtocolError(INVALID_PARAMETER)
+        return N, [packet[4 + i * SAS_SIZE:4 + (i + 1) * SAS_SIZE] for i in range(N)]
+
+    def itr(self, packet):
+        if len(packet) != 18:
+            raise ProtocolError(INVALID_MSG_LENGTH)
+        self.checkAscii(packet[2:14])
+        return struct.pack('>H', 2) + packet[2:] + self.token(packet[2:])
+
+    def itv(self, packet):
+        if len(packet) != 2 + SAS_SIZE:
+            raise ProtocolError(INVALID_MSG_LENGTH)
+        status = 0 if self.validSAS(packet[2:]) else 1
+        return struct.pack('>H', 4) + packet[2:] + bytes([status])
+
+    def gtr(self, packet):
+        N, sass = self.groupCount(packet, 0)
+        if not all(self.validSAS(sas) for sas in sass):
+            raise ProtocolError(INVALID_SINGLE_TOKEN)
+        return struct.pack('>H', 6) + packet[2:] + self.token(*sass)
+
+    def gtv(self, packet):
+        N, sass = self.groupCount(packet, TOKEN_SIZE)
+        if not all(self.validSAS(sas) for sas in sass):
+            raise ProtocolError(INVALID_SINGLE_TOKEN)
+        self.checkAscii(packet[-TOKEN_SIZE:])
+        status = 0 if packet[-TOKEN_SIZE:] == self.token(*sass) else 1
+        return struct.pack('>H', 8) + packet[2:] + bytes([status])
+
+    def handle(self, packet):
+        # answer one request packet, errors are sent as (256, code)
+        methods = {1: self.itr, 3: self.itv, 5: self.gtr, 7: self.gtv}
+        try:
+            if len(packet) < 2:
+                raise ProtocolError(INVALID_MSG_LENGTH)
+            type, = struct.unpack('>H', packet[:2])
+            if type not in methods:
+                raise ProtocolError(INVALID_MSG_CODE)
+            return methods[type](packet)
+        except ProtocolError as e:
+            return struct.pack('>HH', ERROR_TYPE, e.code)
+
+def requestLength(header):
+    # bytes still to read after the first 4 bytes of a TCP request, None for unknown types
+    type, N = struct.unpack('>HH', header)
+    lengths = {1: 14, 3: SAS_SIZE - 2, 5: N * SAS_SIZE, 7: N * SAS_SIZE + TOKEN_SIZE}
+    return lengths.get(type)
+
+class TCPHandler(socketserver.BaseRequestHandler):
+    # a connection may carry any number of requests back to back
+    def recvAll(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def handle(self):
+        while True:
+            header = self.recvAll(4)
+            if header is None:
+                return
+            size = requestLength(header)
+            if size is None:
+                self.request.sendall(self.server.logic.handle(header))
+                return
+            body = self.recvAll(size)
+            if body is None:
+                return
+            self.request.sendall(self.server.logic.handle(header + body))
+
+class UDPHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        packet, sock = self.request
+        sock.sendto(self.server.logic.handle(packet), self.client_address)
+
+class TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    request_queue_size = 128
+    daemon_threads = True
+
+class UDPServer(socketserver.UDPServer):
+    allow_reuse_address = True
+    max_packet_size = 65535
+
+def serve(host='127.0.0.1', port=0, secret=SECRET):
+    # start TCP and UDP servers on the same port in background threads
+    logic = AuthLogic(secret)
+    tcp = TCPServer((host, port), TCPHandler)
+    udp = UDPServer((host, tcp.server_address[1]), UDPHandler)
+    for server in (tcp, udp):
+        server.logic = logic
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return tcp, udp
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local auth server (itr/itv/gtr/gtv over TCP and UDP)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=51111)
+    parser.add_argument('--secret', default=SECRET)
+    args = parser.parse_args()
+    tcp, udp = serve(args.host, args.port, args.secret)
+    print(f'Auth server listening on {args.host}:{tcp.server_address[1]} (TCP and UDP)')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print('Exiting...')
@@ -0,0 +1,146 @@
+import heapq
+import select
+import socket
+import struct
+import time
+
+# Many auth requests in flight on one UDP socket, each reply matched to the request it echoes.
+# Lost datagrams are resent with exponential backoff. This is the only UDP engine: auth.loadgen and
+# client.py at the repository root both drive it, so it imports nothing from the auth package.
+WINDOW = 256
+TIMEOUT = 0.5
+MAX_TIMEOUT = 2.0
+MAX_RETRIES = 5
+BUFFER_SIZE = 65535
+ERROR_TYPE = 256
+TRAILER = {2: 64, 4: 1, 6: 64, 8: 1}  # bytes a response appends to the body of its request
+
+def requestKey(response):
+    # the request a response answers is its type - 1 followed by the response body minus the trailer
+    type, = struct.unpack('>H', response[:2])
+    trailer = TRAILER.get(type)
+    if trailer is None or len(response) <= trailer + 2:
+        return None
+    return struct.pack('>H', type - 1) + response[2:len(response) - trailer]
+
+class UDPRequest:
+    def __init__(self, index, packet, now, timeout):
+        self.index = index
+        self.packet = packet
+        self.started = now
+        self.timeout = timeout
+        self.deadline = now
+        self.retries = 0
+        self.response = None
+        self.error = None  # error code of the reply
+        self.suspect = None  # error code that may answer this request, see UDPEngine.receive
+        self.latency = None
+
+class UDPEngine:
+    def __init__(self, host, port, window=WINDOW, timeout=TIMEOUT, maxRetries=MAX_RETRIES):
+        family, _, _, _, self.address = socket.getaddrinfo(host, int(port), 0, socket.SOCK_DGRAM)[0]
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.window = window
+        self.timeout = timeout
+        self.maxRetries = maxRetries
+        self.pending = {}  # packet -> [UDPRequest]
+        self.timers = []  # heap of (deadline, index, UDPRequest)
+        self.sent = 0
+        self.retransmitted = 0
+
+    def transmit(self, request, now):
+        try:
+            self.sock.sendto(request.packet, self.address)
+        except BlockingIOError:
+            pass  # kernel buffer full, the retransmission timer resends it
+        request.deadline = now + request.timeout
+        heapq.heappush(self.timers, (request.deadline, request.index, request))
+        self.sent += 1
+
+    def submit(self, index, packet, now):
+        request = UDPRequest(index, packet, now, self.timeout)
+        self.pending.setdefault(packet, []).append(request)
+        self.transmit(request, now)
+
+    def finish(self, request, now):
+        request.latency = now - request.started
+        waiting = self.pending[request.packet]
+        waiting.remove(request)
+        if not waiting:
+            del self.pending[request.packet]
+        return request
+
+    def receive(self, now):
+        # drain every datagram already queued on the socket
+        done = []
+        while True:
+            try:
+                response, _ = self.sock.recvfrom(BUFFER_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return done
+            if len(response) == 4 and struct.unpack('>H', response[:2])[0] == ERROR_TYPE:
+                # an error does not echo its request: it answers one of the requests outstanding now.
+                # They keep being retransmitted, valid ones get their real answer and the bad one keeps
+                # drawing errors; those still unanswered after maxRetries report the error
+                code, = struct.unpack('>H', response[2:])
+                requests = [r for waiting in self.pending.values() for r in waiting]
+                if len(requests) == 1:
+                    requests[0].error = code
+                    done.append(self.finish(requests[0], now))
+                    continue
+                for request in requests:
+                    if request.suspect is None:
+                        request.suspect = code
+                continue
+            for request in self.pending.pop(requestKey(response), []):
+                request.response = response
+                request.latency = now - request.started
+                done.append(request)
+
+    def expire(self, now):
+        # retransmit with exponential backoff, give up after maxRetries
+        done = []
+        while self.timers and self.timers[0][0] <= now:
+            deadline, _, request = heapq.heappop(self.timers)
+            if request.latency is not None or deadline != request.deadline:
+                continue
+            if request.retries >= self.maxRetries:
+                done.append(self.finish(request, now))
+                continue
+            request.retries += 1
+            request.timeout = min(request.timeout * 2, MAX_TIMEOUT)
+            self.retransmitted += 1
+            self.transmit(request, now)
+        return done
+
+    def run(self, packets):
+        # yields every request once answered or out of retries, at most `window` in flight
+        packets = iter(enumerate(packets))
+        exhausted = False
+        inflight = 0
+        while True:
+            now = time.monotonic()
+            while not exhausted and inflight < self.window:
+                item = next(packets, None)
+                if item is None:
+                    exhausted = True
+                else:
+                    self.submit(*item, now)
+                    inflight += 1
+            if exhausted and not inflight:
+                return
+            wait = max(0.0, self.timers[0][0] - now) if self.timers else self.timeout
+            readable, _, _ = select.select([self.sock], [], [], wait)
+            now = time.monotonic()
+            done = (self.receive(now) if readable else []) + self.expire(now)
+            inflight -= len(done)
+            yield from done
+
+    def request(self, packet):
+        # send a single request and wait for its response
+        for request in self.run([packet]):
+            return request
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,113 @@
+from array import array
+from types import MappingProxyType
+
+# hits needed to sink each hull
+HULLS = ['frigate', 'destroyer', 'battleship']
+HULL_LIFE = {'frigate': 1, 'destroyer': 2, 'battleship': 3}
+HULL_CODE = {hull: code for code, hull in enumerate(HULLS)}
+LIFE = array('b', [HULL_LIFE[hull] for hull in HULLS])
+BRIDGES = 8
+COLUMNS = ('river', 'bridge', 'hull', 'hits', 'id', 'remaining')
+
+class Board:
+    # columnar snapshot of every ship in one turn, row i is one ship
+    def __init__(self):
+        self.river = array('b')   # 0-based river index
+        self.bridge = array('b')  # 1-based bridge
+        self.hull = array('b')    # index in HULLS
+        self.hits = array('h')
+        self.id = array('q')
+        self.remaining = array('h')  # life left, filled by fromStates
+
+    @classmethod
+    def fromStates(cls, rivers):
+        # rivers[i] is the list of state messages of river i
+        board = cls()
+        for river, states in enumerate(rivers):
+            for state in states:
+                ships = state['ships']
+                n = len(ships)
+                board.river.extend([river] * n)
+                board.bridge.extend([state['bridge']] * n)
+                board.hull.extend([HULL_CODE[ship['hull']] for ship in ships])
+                board.hits.extend([ship['hits'] for ship in ships])
+                board.id.extend([ship['id'] for ship in ships])
+        board.remaining = board.life()
+        return board
+
+    def __len__(self):
+        return len(self.id)
+
+    def life(self):
+        # remaining hits to sink each ship
+        return array('h', [LIFE[h] - hits for h, hits in zip(self.hull, self.hits)])
+
+    def weakestByCell(self):
+        # one pass over the ships: (bridge, river) -> row of the ship with the least life left
+        weakest = {}
+        remaining = self.remaining
+        for row, cell in enumerate(zip(self.bridge, self.river)):
+            if cell not in weakest or remaining[row] < remaining[weakest[cell]]:
+                weakest[cell] = row
+        return weakest
+
+    def shipsByCell(self):
+        # (bridge, river) -> rows of the ships in that cell
+        cells = {}
+        for row, cell in enumerate(zip(self.bridge, self.river)):
+            cells.setdefault(cell, []).append(row)
+        return cells
+
+    def rowsById(self):
+        return {id: row for row, id in enumerate(self.id)}
+
+    def cellSignatures(self):
+        # (bridge, river) -> the ships in it as sorted (id, hull, hits), to compare two boards cell by cell
+        cells = {}
+        for row, cell in enumerate(zip(self.bridge, self.river)):
+            cells.setdefault(cell, []).append((self.id[row], self.hull[row], self.hits[row]))
+        return {cell: tuple(sorted(ships)) for cell, ships in cells.items()}
+
+    def select(self, rows):
+        # new board holding only the given rows, in that order
+        board = Board()
+        for name in COLUMNS:
+            column = getattr(self, name)
+            getattr(board, name).extend([column[row] for row in rows])
+        return board
+
+    def project(self, plan):
+        # where the ships will be next turn if the plan {cannon: row} is fired: every ship moves one
+        # bridge, sunk ships and ships past the last bridge are gone, new ships are unknown
+        shots = {}
+        for row in plan.values():
+            shots[row] = shots.get(row, 0) + 1
+        rows = [row for row in range(len(self))
+                if self.remaining[row] > shots.get(row, 0) and self.bridge[row] < BRIDGES]
+        board = self.select(rows)
+        for i, row in enumerate(rows):
+            board.bridge[i] += 1
+            board.hits[i] += shots.get(row, 0)
+            board.remaining[i] -= shots.get(row, 0)
+        return board
+
+    def ship(self, row):
+        return {'id': self.id[row], 'hull': HULLS[self.hull[row]], 'hits': self.hits[row],
+                'river': self.river[row], 'bridge': self.bridge[row]}
+
+def cannonCells(cannon):
+    # (bridge, river) cells a cannon at (x, y) reaches: rivers y and y+1, 1-based
+    x, y = cannon
+    return [(x, river - 1) for river in (y, y + 1) if 1 <= river <= 4]
+
+class CannonIndex:
+    # cannons never move, so the cells they cover are indexed once after getcannons
+    def __init__(self, cannons=()):
+        cells = {}
+        covers = {}
+        for cannon in map(tuple, cannons):
+            cells[cannon] = tuple(cannonCells(cannon))
+            for cell in cells[cannon]:
+                covers.setdefault(cell, []).append(cannon)
+        self.cells = MappingProxyType(cells)  # cannon -> cells
+        self.cannons = MappingProxyType({cell: tuple(c) for cell, c in covers.items()})  # cell -> cannons
@@ -0,0 +1,93 @@
+from socket_t import *
+import selectors
+import time
+
+class IOEngine:
+    # single-threaded event loop over the river sockets, created once per game
+    def __init__(self, sockets):
+        self.sockets = sockets
+        self.selector = selectors.DefaultSelector()
+        for i, s in enumerate(sockets):
+            self.selector.register(s.socket, selectors.EVENT_READ, i)
+        self.pending = [[] for s in sockets]
+        self.keyed = [{} for s in sockets]  # river -> key -> request, for REPLY_KEYS reply types
+
+    def submit(self, requests):
+        # send the requests right away, replies are collected by run()
+        now = time.monotonic()
+        for r in requests:
+            self.sockets[r.river].transmit(r, now)
+            if not r.done():
+                self.pending[r.river].append(r)
+                if r.key is not None:
+                    self.keyed[r.river][r.key] = r
+        return requests
+
+    def dispatch(self, river, data, now):
+        # keyed replies go straight to their request, others to the oldest pending request accepting them
+        key = REPLY_KEYS.get(data['type'])
+        if key is not None:
+            r = self.keyed[river].pop(key(data), None)
+            if r is None:
+                return None  # duplicate reply to a request already answered
+            self.sockets[river].receive(r, data, now)
+            self.pending[river].remove(r)
+            return r
+        for r in self.pending[river]:
+            if r.accept(data):
+                self.sockets[river].receive(r, data, now)
+                if r.done():
+                    self.pending[river].remove(r)
+                return r
+        return None
+
+    def expire(self, now):
+        # resend requests still missing replies, give up on those out of retries
+        failed = []
+        for river, pending in enumerate(self.pending):
+            for r in list(pending):
+                if r.deadline > now:
+                    continue
+                try:
+                    self.sockets[river].retransmit(r, now)
+                except RequestTimeout:
+                    pending.remove(r)
+                    self.keyed[river].pop(r.key, None)
+                    failed.append(r)
+        return failed
+
+    def run(self, requests=()):
+        # loop until every pending request is answered or failed, GameOver propagates to the caller
+        failed = []
+        try:
+            while any(self.pending):
+                now = time.monotonic()
+                deadline = min(r.deadline for pending in self.pending for r in pending)
+                for key, _ in self.selector.select(max(0.0, deadline - now)):
+                    # replies nobody waits for are dropped before being decoded
+                    wanted = {r.expect for r in self.pending[key.data]}
+                    data = self.sockets[key.data].recvM(wanted)
+                    if data is not None:
+                        self.dispatch(key.data, data, time.monotonic())
+                failed += self.expire(time.monotonic())
+        except GameOver:
+            self.pending = [[] for s in self.sockets]
+            self.keyed = [{} for s in self.sockets]
+            raise
+        if failed:
+            raise RequestTimeout(failed)
+        return [r.result() for r in requests]
+
+    def request(self, requests):
+        return self.run(self.submit(requests))
+
+    def stats(self):
+        # request counters summed over every river socket
+        total = {}
+        for s in self.sockets:
+            for key, value in s.stats.items():
+                total[key] = total.get(key, 0) + value
+        return total
+
+    def close(self):
+        self.selector.close()
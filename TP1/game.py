@@ -1,10 +1,17 @@
 from socket_t import *
-import threading
-from concurrent.futures import *
+from engine import *
+from board import *
+from strategy import *
+from tracing import *
+from speculate import *
+import time
+
+AUTH_ATTEMPTS = 3  # authreq tries while the server still runs a game for the same GAS
 
 class Game:
     # implementation of the game -> send requests to the server and control the board
-    def __init__(self, host, port, token=None):
+    def __init__(self, host, port, token=None, strategy='optimal', tracer=None, predictive=False,
+                 recorder=None, socket_factory=Socket):
         self.auth_token = None
         self.token = token
         self.host = host
@@ -13,197 +20,166 @@ class Game:
         # start the game logic
         self.turn = 0
         self.cannons = []
+        self.index = CannonIndex()
+        self.strategy = makeStrategy(strategy)
+        # predictive mode: plan turn t+1 while its states are in flight
+        self.speculator = Speculator(self.strategy) if predictive else None
+        self.plan = None  # plan patched from the prediction for the current turn
+        self.last = None  # (board, plan) of the last turn played
         self.state = []
-        self.rivers = [River(i) for i in range(1,5)]
+        self.board = Board()
+        self.turn_times = []
+        self.result = None  # gameover message that ended the game
 
-        # sockets implementation for the game
-        self.sockets = [Socket(host, port+i) for i in range(4)]
+        # sockets implementation for the game, one event loop drives all of them
+        self.tracer = tracer or NULL_TRACER
+        self.recorder = recorder  # record.Recorder logging the session, or None
+        self.socket_factory = socket_factory  # (host, port) -> Socket, replaced to replay a session
+        self.connect()
         self.shot_list = []
 
-        self.condition = threading.Condition()
+    def connect(self):
+        self.sockets = [self.socket_factory(self.host, self.port+i) for i in range(4)]
+        for i, s in enumerate(self.sockets):
+            s.trace(self.tracer, i)
+            if self.recorder:
+                s.record(self.recorder, i)
+        self.engine = IOEngine(self.sockets)
+
+    def disconnect(self):
+        self.engine.close()
+        for s in self.sockets:
+            s.close()
     
     def authreq(self):
-        # auth req to the server passing in the GAS
+        # auth req to the server passing in the GAS; a game still running for it is quit and the
+        # authreq tried again, any other gameover means the GAS was refused
         data = {}
-        for s in self.sockets:
-            # send a req to every server
+        for attempt in range(AUTH_ATTEMPTS):
             try:
-                message = {'auth': self.token, 'type': 'authreq'}
-                data = s.send(message)
-                self.auth_token = data['auth']
+                # send a req to every server at once
+                requests = [Request(i, {'auth': self.token, 'type': 'authreq'}) for i in range(len(self.sockets))]
+                with self.tracer.span('authreq'):
+                    results = self.engine.request(requests)
+                for data in results:
+                    self.auth_token = data['auth']
+                self.makeTemplates()
+                return data
             except KeyboardInterrupt:
                 print('Exiting...')
+                return data
             except GameOver as e:
-                running = 'running game'
-                if running in e.data["description"]:
-                    self.quit()
-                    for s in self.sockets:
-                        s.close()
-                    self.sockets = [Socket(self.host, self.port+i) for i in range(4)]
+                description = e.data.get('description', '') if isinstance(e.data, dict) else str(e.data)
+                if 'running game' not in description:
+                    raise AuthError(e.data)
                 print('A error occurs...', e.message)
                 self.quit()
-                return self.authreq()
-        return data
-    
+                self.disconnect()
+                self.connect()
+        raise AuthError(f'a game is still running after {AUTH_ATTEMPTS} attempts')
+
+    def makeTemplates(self):
+        # messages sent every turn, pre-encoded with the auth token
+        self.templates = {
+            'getturn': MessageTemplate({'auth': self.auth_token, 'type': 'getturn'}, ('turn',)),
+            'shot': MessageTemplate({'auth': self.auth_token, 'type': 'shot'}, ('cannon', 'id')),
+        }
+
     def getCannons(self):
         # cannon placement to all server
         data = {}
         try:
             message = {'auth': self.auth_token, 'type': 'getcannons'}
-            data = self.sockets[0].send(message)
+            with self.tracer.span('getcannons'):
+                data, = self.engine.request([Request(0, message)])
             self.cannons = data['cannons']
+            self.index = CannonIndex(self.cannons)
         except ServerError as e:
             print('An error occurs', e.message)
         return data
     
-    def getTurnServer(self):
-        # advance the state
-        for i, s in enumerate(self.sockets):
-            try:
-                message = {'auth': self.auth_token, 'type': 'getturn', 'turn': self.turn}
-                self.rivers[i].ships = [[] for i in range(8)]
-                states = s.send(message, 8)
-                for state in states:
-                    for ship in state['ships']:
-                        ship['river'] = i
-                    self.rivers[i].ships[state['bridge']-1] += state['ships']
-            except GameOver as e:
-                print(e.data)
-                print(s.turn)
-                return False
-        return True
-    
     def getTurn(self):
-        # advance the state
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            p = []
-            for i in range(len(self.sockets)):
-                p.append(executor.submit(self.getTurnServer))
-            turn = True
-            for f in as_completed(p):
-                turn = turn and f.result()
-                if not turn:
-                    break
-        return turn
-
-    def shot(self):
-        self.shot_list = self.shotStrategy()
-        threads = []
-        for i in range(4):
-            c_thread = threading.Thread(target=self.shotServer, args=(i,))
-            c_thread.start()
-            threads.append(c_thread)
-        while self.shot_list:
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                p = []
-                with self.condition:
-                    for target in self.shot_list:
-                        p.append(executor.submit(self.shotMessage, target))
-                for t in p:
-                    t.result()
-            with self.condition:
-                self.condition.modify_all()
-        with self.condition:
-            self.condition.notify_all()
-        for t in threads:
-            t.join()
-    
-    def shotMessage(self, target):
-        x, y, id, river = target
+        # advance the state: one getturn per river, all in flight together
+        started = time.monotonic()
+        self.tracer.beginTurn(self.turn)
+        template = self.templates['getturn']
+        message, payload = template.message(self.turn), template.encode(self.turn)
+        requests = [TurnRequest(i, message, payload=payload) for i in range(len(self.sockets))]
         try:
-            message = {'auth': self.auth_token, 'type': 'shot', 'x': x, 'y': y, 'id': id}
-            self.sockets[river].send(message)
-            with self.condition:
-                self.condition.notify_all()
-        except:
-            pass
+            with self.tracer.span('getturn'):
+                self.engine.submit(requests)
+                if self.speculator and self.last:
+                    with self.tracer.span('speculate'):
+                        self.speculator.predict(*self.last, self.index)
+                self.engine.run(requests)
+        except GameOver as e:
+            print(e.data)
+            self.result = e.data
+            return False
+        except RequestTimeout as e:
+            # play the turn with what arrived, but say what is missing
+            for r in e.requests:
+                print(f'River {r.river + 1}: no state for bridges {r.missing()} of turn {self.turn}')
+        results = [r.result() for r in requests]
+        # fresh snapshot of the board, nothing is carried over from the last turn
+        self.board = Board.fromStates(results)
+        if self.speculator:
+            with self.tracer.span('patch'):
+                self.plan = self.speculator.patch(self.board, self.index)
+        self.turn_times.append(time.monotonic() - started)
+        return True
 
-    def receiveShot(self, river):
-        while(self.shot_list):
-            with self.condition:
-                self.condition.wait()
-                if not self.shot_list:
-                    break
-                r = self.sockets[river].receive()
-                if r and r['type'] == 'shot':
-                    if r['status'] != 0:
-                        raise ServerError(message = 'Shot gone wrong'+str(r))
-                    x,y = r['cannon']
-                    id = r['id']
-                    target = (x, y, id, river)
-                    with self.condition:
-                        if target in self.shot_list:
-                            self.shot_list.remove(target)
-                            self.condition.notify_all()            
-        while self.sockets[river].listen() != None:
-            continue
+    def shot(self, shot_list=None):
+        # every shot of the turn goes out in one burst, shotresp replies are matched by (cannon, id)
+        # and only the shots left unanswered are resent; False once the game is over
+        self.shot_list = self.shotStrategy() if shot_list is None else shot_list
+        template = self.templates['shot']
+        requests = [ShotRequest(river, template.message([x, y], id), template.encode([x, y], id))
+                    for x, y, id, river in self.shot_list]
+        try:
+            with self.tracer.span('shot'):
+                self.engine.request(requests)
+        except GameOver as e:
+            # the last ship sank or the game ran out of turns on this shot
+            print(e.data)
+            self.result = e.data
+            return False
+        except RequestTimeout as e:
+            print('Shot without answer', [r.message for r in e.requests])
+        for r in requests:
+            if r.replies and r.replies[0]['status'] != 0:
+                print('Shot gone wrong', r.replies[0])
+        return True
 
     def getTargets(self):
-        # potential targets for each cannon
-        poss_targets = {}
-        for cannon in self.cannons:
-            x, y = cannon
-            positions = set()
-            if y==0:
-                positions.add((x, 1)) # river 1
-            elif y==4:
-                positions.add((x, 4)) # river 4
-            else:
-                positions.add((x, y-1)) # river above
-                positions.add((x, y+1)) # river below
-            for p_x, p_y in positions:
-                river = self.rivers[p_y-1]
-                ships = river.ships[p_x-1]
-                if ships:
-                    if x not in poss_targets:
-                        poss_targets[x] = {}
-                    if y not in poss_targets[x]:
-                        poss_targets[x][y] = []
-                    poss_targets[x][y] += ships
-        return poss_targets
+        # potential targets for each cannon: rows of every ship it can reach
+        return targets(self.board, self.index)
 
-    def getWeakBoat(self, boats):
-        # get the weakest boat
-        life = {
-            'frigate': 1,
-            'destroyer': 2,
-            'battleship': 3
-            }
-        weakest = boats[0]
-        weakest['life'] = life[weakest['hull']] - weakest['hits']
-        for boat in boats:
-            boat['life'] = life[boat['hull']] - boat['hits']
-            if boat['hits'] > weakest['hits']:
-                weakest = boat
-        return weakest
+    def getWeakBoat(self, rows):
+        # the ship with the least life left
+        remaining = self.board.remaining
+        return min(rows, key=remaining.__getitem__)
     
     def shotStrategy(self):
-        # get the best shot strategy
-        poss_shot = []
-        poss_targets = self.getTargets()
-        for x, y_dict in poss_targets:
-            for y, boats in y_dict.items():
-                poss_shot.append((x, y, 
-                                  self.getWeakBoat(boats)['id'], 
-                                  self.getWeakBoat(boats)['river']))
-        return set(poss_shot)
+        # get the best shot strategy: one target per cannon from the pluggable strategy
+        board = self.board
+        plan, self.plan = self.plan, None
+        if plan is None:
+            with self.tracer.span('strategy'):
+                plan = self.strategy.plan(board, self.index)
+        self.last = (board, plan)
+        return set((x, y, board.id[row], board.river[row]) for (x, y), row in plan.items())
 
     def quit(self):
         # send quit message to all sockets
         try:
             message = {'auth': self.auth_token, 'type': 'quit'}
-            for s in self.sockets:
-                s.send(message)
+            self.engine.request([Request(i, message) for i in range(len(self.sockets))])
         except KeyboardInterrupt:
             print('Exiting...')
-        except GameOver as e:
+        except (ServerError, OSError):
             pass
     
     def __del__(self):
         # close all sockets
         return self.quit()
-    
-class River:
-    def __init__(self, river_id):
-        self.river_id = river_id
-        self.ships = [[] for i in range(8)]
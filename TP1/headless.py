@@ -0,0 +1,103 @@
+import argparse
+import multiprocessing
+import os
+import time
+
+from game import *
+from record import Recorder
+import simulator
+
+# Plays full games against the local river simulator and reports timings and score
+PHASES = ['authreq', 'getcannons', 'getturn', 'strategy', 'shot']
+
+def timed(times, phase, call, *args):
+    started = time.perf_counter()
+    result = call(*args)
+    times[phase].append(time.perf_counter() - started)
+    return result
+
+def playGame(host, port, strategy='optimal', gas='headless', tracer=None, predictive=False,
+             recorder=None, socket_factory=Socket):
+    # one full game, returns per-phase durations, number of turns and the gameover message
+    times = {phase: [] for phase in PHASES}
+    game = Game(host, port, token=gas, strategy=strategy, tracer=tracer, predictive=predictive,
+                recorder=recorder, socket_factory=socket_factory)
+    started = time.perf_counter()
+    timed(times, 'authreq', game.authreq)
+    timed(times, 'getcannons', game.getCannons)
+    while timed(times, 'getturn', game.getTurn):
+        shots = timed(times, 'strategy', game.shotStrategy)
+        over = not timed(times, 'shot', game.shot, shots)
+        game.turn += 1
+        if over:
+            break
+    elapsed = time.perf_counter() - started
+    stats = game.engine.stats()
+    if game.speculator:
+        stats['speculated_turns'] = game.speculator.turns
+        stats['plans_reused'] = game.speculator.reused
+        stats['cannons_replanned'] = game.speculator.replanned
+    game.quit()
+    game.disconnect()
+    return times, game.turn, elapsed, game.result, stats
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
+
+def report(times, turns, elapsed, result, stats):
+    print(f'{turns} turns in {elapsed:.3f}s ({turns / elapsed:.1f} turns/s)')
+    for phase in PHASES:
+        values = times[phase]
+        if values:
+            mean = sum(values) / len(values)
+            print(f'  {phase:<10} n={len(values):<5} mean={mean * 1000:.3f}ms '
+                  f'p95={percentile(values, 95) * 1000:.3f}ms max={max(values) * 1000:.3f}ms')
+    print(f'  requests: {stats}')
+    if result:
+        print(f'  score: {result.get("score")}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play games against the local river simulator')
+    parser.add_argument('--games', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--turns', type=int, default=100)
+    parser.add_argument('--cannons', type=int, default=8)
+    parser.add_argument('--spawn', type=float, default=0.5)
+    parser.add_argument('--loss', type=float, default=0.0)
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='optimal')
+    parser.add_argument('--predictive', action='store_true', help='plan each turn while its states are in flight')
+    parser.add_argument('--trace', help='write a trace of each game (.jsonl for JSON lines, else Chrome trace)')
+    parser.add_argument('--record', help='log every message of each game for record.py to replay')
+    parser.add_argument('--compress', action='store_true', help='zlib-compress the --record log')
+    args = parser.parse_args()
+
+    for i in range(args.games):
+        # the simulator runs in its own process so it does not share the GIL with the game
+        ready = multiprocessing.Queue()
+        server = multiprocessing.Process(target=simulator.serve, daemon=True, args=(ready,),
+                                         kwargs={'seed': args.seed + i, 'turns': args.turns, 'cannons': args.cannons,
+                                                 'spawn': args.spawn, 'loss': args.loss})
+        server.start()
+        port = ready.get()
+        print(f'game {i + 1} (seed {args.seed + i}, strategy {args.strategy})')
+        tracer = Tracer() if args.trace else None
+        recorder = None
+        if args.record:
+            root, ext = os.path.splitext(args.record)
+            path = args.record if args.games == 1 else f'{root}.{i + 1}{ext}'
+            recorder = Recorder(path, compress=args.compress)
+        try:
+            report(*playGame('127.0.0.1', port, args.strategy, tracer=tracer, predictive=args.predictive,
+                             recorder=recorder))
+            if recorder:
+                recorder.close()
+                print(f'  {recorder.records} messages recorded to {path}')
+            if tracer:
+                root, ext = os.path.splitext(args.trace)
+                path = args.trace if args.games == 1 else f'{root}.{i + 1}{ext}'
+                tracer.write(path)
+                print(f'  trace written to {path}')
+        finally:
+            server.terminate()
+            server.join()
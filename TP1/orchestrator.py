@@ -0,0 +1,145 @@
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from auth.client import auth
+from auth.server import serve
+from headless import playGame, percentile
+from game import *
+import simulator
+
+# Plays many games at once: one process per game slot, each game driven by its own IOEngine loop.
+# Tokens are shared by every process through a Manager dict, so a student id is authenticated once.
+# A worker plays one game at a time, so --workers is the number of games in flight; games spend
+# most of their time waiting on the network, hence several workers per core by default.
+NONCE = 20
+WORKERS_PER_CPU = 4
+cache = None  # (host, port, command...) -> token, set in every worker by init()
+
+def init(shared):
+    global cache
+    cache = shared
+
+def cachedAuth(host, port, command):
+    # returns (token, hit)
+    key = (host, port) + tuple(map(str, command))
+    token = cache.get(key)
+    if token is not None:
+        return token, True
+    token = auth(host, port, command)
+    if token is None or isinstance(token, Exception):
+        raise ServerError(f'{command[0]} failed: {token}')
+    # two processes may race for the same key, both keep the first token stored
+    return cache.setdefault(key, token), False
+
+def groupToken(host, port, ids):
+    hits = 0
+    sas = []
+    for id in ids:
+        token, hit = cachedAuth(host, port, ['itr', id, NONCE])
+        sas.append(token)
+        hits += hit
+    gas, hit = cachedAuth(host, port, ['gtr', len(sas)] + sas)
+    return gas, hits + hit
+
+def playOne(spec, host, port, auth_port, local):
+    # one game in a worker process, returns its metrics
+    started = time.perf_counter()
+    gas, hits = groupToken(host, auth_port, spec['ids'])
+    auth_time = time.perf_counter() - started
+    servers = None
+    if local:
+        # the river servers of a local game run beside it, in a thread of the same worker
+        game = simulator.RiverGame(spec['seed'], spec['turns'], gas=gas)
+        servers = simulator.RiverServers(game, host, 0, seed=spec['seed'])
+        threading.Thread(target=servers.serveForever, daemon=True).start()
+        port = servers.port
+    try:
+        times, turns, elapsed, result, stats = playGame(host, port, spec['strategy'], gas=gas,
+                                                        predictive=spec['predictive'])
+    finally:
+        if servers:
+            servers.close()
+    return {'name': spec['name'], 'pid': os.getpid(), 'strategy': spec['strategy'], 'turns': turns,
+            'elapsed': elapsed, 'auth': auth_time, 'cache_hits': hits,
+            'turn_p95': percentile(times['getturn'], 95), 'score': (result or {}).get('score'), 'stats': stats}
+
+def readSpecs(path, strategy, predictive, turns, seed):
+    # one game per line: "id1 id2 [strategy]", blank lines and # comments are skipped
+    specs = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split('#')[0].split()
+            if not fields:
+                continue
+            ids, name = fields[:2], fields[2] if len(fields) > 2 else strategy
+            specs.append(makeSpec(len(specs), ids, name, predictive, turns, seed))
+    return specs
+
+def makeSpec(i, ids, strategy, predictive, turns, seed):
+    return {'name': f'game {i + 1} ({" ".join(ids)})', 'ids': list(ids), 'strategy': strategy,
+            'predictive': predictive, 'turns': turns, 'seed': seed + i}
+
+def runGames(specs, host, port, auth_port, local, workers):
+    # yields the metrics of every game as it ends
+    with multiprocessing.Manager() as manager:
+        shared = manager.dict()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init, initargs=(shared,)) as pool:
+            futures = {pool.submit(playOne, spec, host, port, auth_port, local): spec for spec in specs}
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    yield {'name': futures[future]['name'], 'error': repr(e)}
+
+def report(metrics, elapsed):
+    played = [m for m in metrics if 'error' not in m]
+    turns = sum(m['turns'] for m in played)
+    print(f'{len(played)}/{len(metrics)} games, {turns} turns in {elapsed:.2f}s: '
+          f'{len(played) / elapsed * 3600:.0f} games/h, {turns / elapsed:.1f} turns/s, '
+          f'{len({m["pid"] for m in played})} processes')
+    if played:
+        auth_times = [m['auth'] for m in played]
+        print(f'  auth: mean={sum(auth_times) / len(auth_times) * 1000:.1f}ms, '
+              f'cache hits={sum(m["cache_hits"] for m in played)}')
+        print(f'  getturn p95: worst game {max(m["turn_p95"] for m in played) * 1000:.2f}ms')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play many games in parallel across a process pool')
+    parser.add_argument('host', nargs='?', default='rubick.snes.2advanced.dev')
+    parser.add_argument('port', nargs='?', type=int, default=51111)
+    parser.add_argument('--specs', help='file with one game per line: id1 id2 [strategy]')
+    parser.add_argument('--games', type=int, default=8, help='number of generated games when --specs is not given')
+    parser.add_argument('--workers', type=int, default=WORKERS_PER_CPU * (os.cpu_count() or 1),
+                        help='processes, one game in flight each (default: %(default)s)')
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='optimal')
+    parser.add_argument('--predictive', action='store_true')
+    parser.add_argument('--local', action='store_true', help='local auth server and one simulated game per spec')
+    parser.add_argument('--turns', type=int, default=100, help='turns of each simulated game')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    host, port, auth_port = args.host, args.port, args.port
+    if args.local:
+        host = '127.0.0.1'
+        tcp, udp = serve(host)
+        auth_port = tcp.server_address[1]
+    if args.specs:
+        specs = readSpecs(args.specs, args.strategy, args.predictive, args.turns, args.seed)
+    else:
+        specs = [makeSpec(i, [f'{2 * i:012d}', f'{2 * i + 1:012d}'], args.strategy, args.predictive,
+                          args.turns, args.seed) for i in range(args.games)]
+
+    started = time.perf_counter()
+    metrics = []
+    for m in runGames(specs, host, port, auth_port, args.local, args.workers):
+        metrics.append(m)
+        if 'error' in m:
+            print(f'{m["name"]}: {m["error"]}')
+        else:
+            print(f'{m["name"]} [pid {m["pid"]}, {m["strategy"]}]: {m["turns"]} turns in {m["elapsed"]:.2f}s, '
+                  f'score {m["score"]}')
+    report(metrics, time.perf_counter() - started)
@@ -0,0 +1,194 @@
+import argparse
+import socket
+import struct
+import time
+import zlib
+
+from socket_t import *
+
+# Binary log of one game session: every message sent and received per river.
+# A log holds a single session, Recorder refuses an existing file instead of appending to it.
+#   header: MAGIC, flags (1 byte)
+#   record: direction (1 byte), river (1 byte), seconds since start (double), length (4 bytes), payload
+# With FLAG_ZLIB the records after the header are one zlib stream.
+MAGIC = b'TPRL1'
+FLAG_ZLIB = 0x01
+RECORD = struct.Struct('!BBdI')
+OUT = 0
+IN = 1
+
+class Recorder:
+    # shared by the four sockets of a game, flushed every `flush_every` records
+    def __init__(self, path, compress=False, flush_every=256):
+        flags = FLAG_ZLIB if compress else 0
+        try:
+            self.file = open(path, 'xb')
+        except FileExistsError:
+            # replies of two sessions would be served back as one game
+            raise FileExistsError('%s already holds a session log, record to a new file' % path) from None
+        self.file.write(MAGIC + bytes([flags]))
+        self.compressor = zlib.compressobj() if compress else None
+        self.origin = time.monotonic()
+        self.flush_every = flush_every
+        self.pending = 0
+        self.records = 0
+
+    def sent(self, river, payload):
+        self.record(OUT, river, payload)
+
+    def received(self, river, payload):
+        self.record(IN, river, payload)
+
+    def record(self, direction, river, payload):
+        data = RECORD.pack(direction, river, time.monotonic() - self.origin, len(payload)) + bytes(payload)
+        if self.compressor:
+            data = self.compressor.compress(data)
+        self.file.write(data)
+        self.records += 1
+        self.pending += 1
+        if self.pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.compressor:
+            self.file.write(self.compressor.flush(zlib.Z_SYNC_FLUSH))
+        self.file.flush()
+        self.pending = 0
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.compressor:
+            self.file.write(self.compressor.flush(zlib.Z_FINISH))
+        self.file.close()
+
+def readChunks(f, compressed, size=1 << 16):
+    if not compressed:
+        yield from iter(lambda: f.read(size), b'')
+        return
+    decompressor = zlib.decompressobj()
+    for chunk in iter(lambda: f.read(size), b''):
+        while chunk:
+            yield decompressor.decompress(chunk)
+            chunk = decompressor.unused_data
+            if decompressor.eof:
+                decompressor = zlib.decompressobj()
+    yield decompressor.flush()
+
+def readLog(path):
+    # yield (direction, river, timestamp, payload) for every record, streaming
+    with open(path, 'rb') as f:
+        header = f.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError('not a session log: ' + path)
+        buffer = b''
+        for chunk in readChunks(f, header[-1] & FLAG_ZLIB):
+            buffer += chunk
+            offset = 0
+            while len(buffer) - offset >= RECORD.size:
+                direction, river, timestamp, length = RECORD.unpack_from(buffer, offset)
+                end = offset + RECORD.size + length
+                if end > len(buffer):
+                    break
+                yield direction, river, timestamp, buffer[offset + RECORD.size:end]
+                offset = end
+            buffer = buffer[offset:]
+
+def requestKey(message):
+    # what a reply answers, independent of auth tokens and retransmissions
+    type = message.get('type')
+    if type == 'getturn':
+        return ('getturn', message.get('turn'))
+    if type == 'shot':
+        return ('shot',) + shotKey(message)
+    return (type,)
+
+REPLY_TO = {'authresp': 'authreq', 'cannons': 'getcannons'}
+
+def replyKey(message, last):
+    # the request a recorded reply answered; gameover answers whatever was sent last on that river
+    type = message.get('type')
+    if type == 'state':
+        return ('getturn', message.get('turn'))
+    if type == 'shotresp':
+        return ('shot',) + shotKey(message)
+    if type in REPLY_TO:
+        return (REPLY_TO[type],)
+    return last
+
+class Replayer:
+    # recorded replies indexed by river and request, served back through socket pairs
+    def __init__(self, path):
+        self.replies = {}  # (river, request key) -> [payload]
+        self.seen = set()
+        last = {}
+        for direction, river, timestamp, payload in readLog(path):
+            message = loads(payload)
+            if direction == OUT:
+                last[river] = requestKey(message)
+                continue
+            key = replyKey(message, last.get(river))
+            if key is None:
+                continue
+            # states arrive once per bridge, retransmitted copies are dropped
+            unique = (river, key, message.get('bridge'), message.get('type'))
+            if unique in self.seen:
+                continue
+            self.seen.add(unique)
+            self.replies.setdefault((river, key), []).append(payload)
+        self.base = None
+
+    def socket(self, host, port):
+        # socket factory for Game: the first port asked for is river 0
+        if self.base is None:
+            self.base = port
+        return ReplaySocket(self, port - self.base)
+
+    def answer(self, river, message):
+        replies = self.replies.get((river, requestKey(message)))
+        if replies is not None:
+            return replies
+        if message.get('type') == 'shot':
+            # a shot the recorded game did not fire: refuse it instead of letting it time out
+            return [dumps({'type': 'shotresp', 'auth': message.get('auth'), 'cannon': message.get('cannon'),
+                           'id': message.get('id'), 'status': 1, 'description': 'not in the recording'})]
+        return []
+
+class ReplaySocket(Socket):
+    # a Socket whose server is the recording, replies are queued on a local socket pair
+    def __init__(self, replayer, river):
+        self.replayer = replayer
+        super().__init__('replay', river)
+        self.river = river
+
+    def newSocket(self):
+        self.socket, self.peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.settimeout(INITIAL_RTO)
+        return self.socket
+
+    def sendM(self, message):
+        if isinstance(message, bytes):
+            message = loads(message)
+        for reply in self.replayer.answer(self.river, message):
+            self.peer.send(reply)
+        return self.socket
+
+    def close(self):
+        super().close()
+        self.peer.close()
+
+if __name__ == '__main__':
+    from headless import playGame, report
+    from strategy import STRATEGIES
+
+    parser = argparse.ArgumentParser(description='Replay a recorded game session through Game')
+    parser.add_argument('log')
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='optimal')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--predictive', action='store_true')
+    args = parser.parse_args()
+
+    replayer = Replayer(args.log)
+    for i in range(args.repeat):
+        replayer.base = None
+        report(*playGame('replay', 0, args.strategy, socket_factory=replayer.socket, predictive=args.predictive))
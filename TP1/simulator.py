@@ -0,0 +1,195 @@
+import argparse
+import json
+import random
+import selectors
+import socket
+
+# Local stand-in for the four UDP river servers (ports port..port+3)
+RIVERS = 4
+BRIDGES = 8
+HULL_LIFE = {'frigate': 1, 'destroyer': 2, 'battleship': 3}
+HULL_WEIGHTS = {'frigate': 5, 'destroyer': 3, 'battleship': 2}
+
+class Ship:
+    def __init__(self, id, hull, river):
+        self.id = id
+        self.hull = hull
+        self.river = river
+        self.bridge = 1
+        self.hits = 0
+
+    def life(self):
+        return HULL_LIFE[self.hull] - self.hits
+
+    def state(self):
+        return {'id': self.id, 'hull': self.hull, 'hits': self.hits}
+
+class RiverGame:
+    # shared state of one game, the four river servers read and change it
+    def __init__(self, seed=0, turns=100, cannons=8, spawn=0.5, gas=None):
+        self.random = random.Random(seed)
+        self.max_turns = turns
+        self.spawn = spawn
+        self.gas = gas
+        self.turn = 0
+        self.next_id = 0
+        self.ships = []
+        self.cannons = self.placeCannons(cannons)
+        self.fired = {}  # (turn, cannon) -> response, replayed for duplicate shots
+        self.score = {'escaped_ships': 0, 'remaining_life_on_escaped_ships': 0,
+                      'shots_received': 0, 'valid_shots': 0, 'sunk_ships': 0}
+        self.spawnShips()
+
+    def placeCannons(self, n):
+        cells = [[x, y] for x in range(1, BRIDGES + 1) for y in range(RIVERS + 1)]
+        return sorted(self.random.sample(cells, min(n, len(cells))))
+
+    def spawnShips(self):
+        hulls = list(HULL_WEIGHTS)
+        weights = list(HULL_WEIGHTS.values())
+        for river in range(RIVERS):
+            if self.random.random() < self.spawn:
+                hull = self.random.choices(hulls, weights)[0]
+                self.ships.append(Ship(self.next_id, hull, river))
+                self.next_id += 1
+
+    def advance(self):
+        # every ship moves one bridge, ships past the last bridge escape
+        for ship in self.ships:
+            ship.bridge += 1
+        for ship in self.ships:
+            if ship.bridge > BRIDGES:
+                self.score['escaped_ships'] += 1
+                self.score['remaining_life_on_escaped_ships'] += ship.life()
+        self.ships = [ship for ship in self.ships if ship.bridge <= BRIDGES]
+        self.turn += 1
+        self.spawnShips()
+
+    def states(self, river, auth):
+        states = []
+        for bridge in range(1, BRIDGES + 1):
+            ships = [s.state() for s in self.ships if s.river == river and s.bridge == bridge]
+            states.append({'type': 'state', 'auth': auth, 'turn': self.turn, 'bridge': bridge, 'ships': ships})
+        return states
+
+    def gameover(self, description):
+        return {'type': 'gameover', 'status': 0, 'score': dict(self.score), 'description': description}
+
+    def shot(self, river, message):
+        cannon = message.get('cannon')
+        key = (self.turn, tuple(cannon) if cannon else None)
+        if key in self.fired and self.fired[key]['id'] == message.get('id'):
+            return self.fired[key]  # a retransmitted shot is answered again, not fired twice
+        self.score['shots_received'] += 1
+        response = {'type': 'shotresp', 'auth': message.get('auth'), 'cannon': cannon,
+                    'id': message.get('id'), 'status': 0, 'description': ''}
+        ship = next((s for s in self.ships if s.id == message.get('id') and s.river == river), None)
+        if cannon not in self.cannons:
+            response.update(status=1, description='no cannon at this position')
+        elif key in self.fired:
+            response.update(status=1, description='cannon already fired this turn')
+        elif ship is None:
+            response.update(status=1, description='no such ship in this river')
+        elif ship.bridge != cannon[0] or river + 1 not in (cannon[1], cannon[1] + 1):
+            response.update(status=1, description='ship out of reach')
+        else:
+            self.score['valid_shots'] += 1
+            ship.hits += 1
+            if ship.life() <= 0:
+                self.score['sunk_ships'] += 1
+                self.ships.remove(ship)
+        if response['status'] == 0 or key not in self.fired:
+            self.fired[key] = response
+        return response
+
+    def handle(self, river, message):
+        # replies to one message received by a river server
+        type = message.get('type')
+        auth = message.get('auth')
+        if type == 'authreq':
+            if not auth or (self.gas is not None and auth != self.gas):
+                return [self.gameover('authentication failed')]
+            return [{'type': 'authresp', 'auth': auth, 'status': 0}]
+        if type == 'getcannons':
+            return [{'type': 'cannons', 'auth': auth, 'cannons': self.cannons}]
+        if type == 'getturn':
+            turn = message.get('turn', 0)
+            if turn >= self.max_turns:
+                return [self.gameover('game finished')]
+            while self.turn < turn:
+                self.advance()
+            return self.states(river, auth)
+        if type == 'shot':
+            return [self.shot(river, message)]
+        if type == 'quit':
+            return []
+        return [self.gameover('invalid message')]
+
+class RiverServers:
+    # the four UDP servers on one selector, single threaded
+    def __init__(self, game, host='127.0.0.1', port=0, loss=0.0, seed=0):
+        self.game = game
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.sockets, self.port = bindRivers(host, port)
+        self.selector = selectors.DefaultSelector()
+        for river, s in enumerate(self.sockets):
+            self.selector.register(s, selectors.EVENT_READ, river)
+        self.running = True
+
+    def serveForever(self):
+        while self.running:
+            for key, _ in self.selector.select(0.5):
+                data, address = key.fileobj.recvfrom(65535)
+                try:
+                    message = json.loads(data)
+                except ValueError:
+                    message = {}
+                for reply in self.game.handle(key.data, message):
+                    if self.random.random() >= self.loss:
+                        key.fileobj.sendto(json.dumps(reply).encode(), address)
+
+    def close(self):
+        self.running = False
+        self.selector.close()
+        for s in self.sockets:
+            s.close()
+
+def bindRivers(host, port):
+    # bind port..port+3, or the first free block of four ports when port is 0
+    candidates = [port] if port else range(20000, 60000, 4)
+    for base in candidates:
+        sockets = []
+        try:
+            for river in range(RIVERS):
+                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sockets.append(s)
+                s.bind((host, base + river))
+            return sockets, base
+        except OSError:
+            for s in sockets:
+                s.close()
+    raise OSError('no free block of %d UDP ports' % RIVERS)
+
+def serve(ready=None, host='127.0.0.1', port=0, seed=0, turns=100, cannons=8, spawn=0.5, loss=0.0, gas=None):
+    # run a simulated game until the process ends; `ready` (a Queue) receives the base port
+    servers = RiverServers(RiverGame(seed, turns, cannons, spawn, gas), host, port, loss, seed)
+    if ready is not None:
+        ready.put(servers.port)
+    servers.serveForever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local river servers for offline games')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=51111)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--turns', type=int, default=100)
+    parser.add_argument('--cannons', type=int, default=8)
+    parser.add_argument('--spawn', type=float, default=0.5, help='chance of a new ship per river per turn')
+    parser.add_argument('--loss', type=float, default=0.0, help='chance of dropping each reply')
+    args = parser.parse_args()
+    print(f'River servers on {args.host}:{args.port}..{args.port + RIVERS - 1}')
+    try:
+        serve(None, args.host, args.port, args.seed, args.turns, args.cannons, args.spawn, args.loss)
+    except KeyboardInterrupt:
+        print('Exiting...')
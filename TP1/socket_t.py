@@ -1,67 +1,285 @@
 import socket
 import json
+import time
+
+# optional faster JSON backend, the stdlib is the fallback
+try:
+    import orjson
+    loads = orjson.loads
+    dumps = orjson.dumps
+except ImportError:
+    _encoder = json.JSONEncoder(separators=(',', ':'))
+    def loads(data):
+        return json.loads(bytes(data))
+    def dumps(obj):
+        return _encoder.encode(obj).encode()
+
+BUFFER_SIZE = 65535
+TYPE_KEY = b'"type"'
+
+# retransmission timer (RFC 6298 style) and retry limit
+INITIAL_RTO = 0.1
+MIN_RTO = 0.02
+MAX_RTO = 2.0
+MAX_RETRIES = 6
+
+# reply type expected for each request type, None means no reply is expected
+RESP_TYPE = {'authreq': 'authresp', 'getcannons': 'cannons', 'getturn': 'state', 'shot': 'shotresp', 'quit': None}
+
+def peekType(data, end=None):
+    # read the "type" field of data[:end] without decoding the whole message, None if it is not found
+    end = len(data) if end is None else end
+    start = data.find(TYPE_KEY, 0, end)
+    if start < 0:
+        return None
+    start = data.find(b'"', start + len(TYPE_KEY), end)
+    stop = data.find(b'"', start + 1, end)
+    if start < 0 or stop < 0:
+        return None
+    return data[start + 1:stop].decode()
+
+def encodeValue(value):
+    if type(value) is int:
+        return str(value).encode()
+    return dumps(value)
+
+class MessageTemplate:
+    # constant fields (auth, type) are encoded once, the varying ones are spliced in per message
+    def __init__(self, fields, varying=()):
+        self.fields = fields
+        self.varying = varying
+        self.prefix = dumps(fields)[:-1]
+        self.keys = [b',' + dumps(key) + b':' for key in varying]
+
+    def encode(self, *values):
+        parts = [self.prefix]
+        for key, value in zip(self.keys, values):
+            parts.append(key)
+            parts.append(encodeValue(value))
+        parts.append(b'}')
+        return b''.join(parts)
+
+    def message(self, *values):
+        # the same message as a dict
+        message = dict(self.fields)
+        message.update(zip(self.varying, values))
+        return message
+
+class Request:
+    # a message to one river server and the replies collected for it
+    def __init__(self, river, message, n=1, payload=None):
+        self.river = river
+        self.message = message
+        self.payload = payload if payload is not None else dumps(message)  # encoded once, reused on resend
+        self.n = n
+        self.expect = RESP_TYPE[message['type']]
+        self.replies = []
+        # timing and per-request stats
+        self.started = None
+        self.sent_at = None
+        self.answered = None
+        self.deadline = None
+        self.retries = 0
+        self.rtt = None
+        self.failed = False
+        self.key = None  # set by requests whose replies are matched through REPLY_KEYS
+
+    def add(self, data):
+        self.replies.append(data)
+
+    def accept(self, data):
+        # does this reply belong to the request
+        return data['type'] == self.expect
+
+    def done(self):
+        return self.expect is None or len(self.replies) >= self.n
+
+    def result(self):
+        if len(self.replies) == 1:
+            return self.replies[0]
+        return self.replies
+
+class TurnRequest(Request):
+    # getturn: one state per bridge for the requested turn, duplicates are dropped
+    def __init__(self, river, message, bridges=8, payload=None):
+        super().__init__(river, message, bridges, payload)
+        self.states = {}
+
+    def accept(self, data):
+        return (data['type'] == 'state' and data['bridge'] not in self.states
+                and data.get('turn', self.message['turn']) == self.message['turn'])
+
+    def add(self, data):
+        self.states[data['bridge']] = data
+        self.replies = list(self.states.values())
+
+    def missing(self):
+        # bridges whose state has not arrived yet
+        return [b for b in range(1, self.n + 1) if b not in self.states]
+
+    def result(self):
+        return [self.states[b] for b in sorted(self.states)]
+
+def shotKey(data):
+    # shots and their shotresp are matched by (cannon, id)
+    return (tuple(data.get('cannon') or ()), data.get('id'))
+
+# reply types matched to their request by key instead of by arrival order
+REPLY_KEYS = {'shotresp': shotKey}
+
+class ShotRequest(Request):
+    # one shot of a burst, acknowledged by the shotresp echoing its cannon and id
+    def __init__(self, river, message, payload=None):
+        super().__init__(river, message, 1, payload)
+        self.key = shotKey(message)
+
+    def accept(self, data):
+        return data['type'] == 'shotresp' and shotKey(data) == self.key
+
+def makeRequest(river, message, n=1, payload=None):
+    if message['type'] == 'getturn':
+        return TurnRequest(river, message, n, payload)
+    if message['type'] == 'shot':
+        return ShotRequest(river, message, payload)
+    return Request(river, message, n, payload)
+
+class RttEstimator:
+    # smoothed round trip time and retransmission timeout of one server
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = INITIAL_RTO
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + 4 * self.rttvar))
+
+    def timeout(self, retries=0):
+        # exponential backoff on top of the current estimate
+        return min(MAX_RTO, self.rto * (2 ** retries))
 
 class Socket:
     # implementation of socket stop-and-wait
-    def __init__(self, host, port):
+    def __init__(self, host, port, max_retries=MAX_RETRIES):
         self.host = host
         self.port = port
+        self.address = (host, port)
+        self.buffer = bytearray(BUFFER_SIZE)  # reused by every receive
+        self.view = memoryview(self.buffer)
         self.socket = self.newSocket()
+        self.rtt = RttEstimator()
+        self.max_retries = max_retries
+        self.stats = {'requests': 0, 'sent': 0, 'retransmissions': 0, 'failures': 0}
+        self.tracer = None  # set by trace(), None keeps the hooks off
+        self.recorder = None  # set by record(), logs every datagram sent and received
+        self.river = 0
+
+    def trace(self, tracer, river):
+        self.tracer = tracer if tracer.enabled else None
+        self.river = river
+
+    def record(self, recorder, river):
+        self.recorder = recorder
+        self.river = river
     
     def newSocket(self):
-        # TCP socket
+        # UDP socket
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.settimeout(0.1)
+        self.socket.settimeout(INITIAL_RTO)
         return self.socket
     
     def sendM(self, message):
-        # send a message to the server
-        json_message = json.dumps(message)
-        self.socket.sendto(json_message.encode(), (self.host, self.port))
+        # send a message to the server, dicts are encoded and bytes are sent as they are
+        if not isinstance(message, bytes):
+            message = dumps(message)
+        if self.recorder:
+            self.recorder.sent(self.river, message)
+        self.socket.sendto(message, self.address)
         return self.socket
 
-    def recvM(self):
-        # receive a message from the server
+    def recvM(self, wanted=None):
+        # receive a message from the server; with `wanted`, other types are dropped before decoding
         try:
-            data, _ = self.socket.recvfrom(1024)
-            data = json.loads(data.decode())
-            if data['type'] == 'gameover':
-                raise GameOver()
-            return data
+            n, _ = self.socket.recvfrom_into(self.buffer)
         except socket.timeout:
             return None
+        data = self.view[:n]
+        if self.recorder:
+            self.recorder.received(self.river, data)
+        type = peekType(self.buffer, n)
+        if self.tracer:
+            self.tracer.count(self.river, 'received')
+        if wanted is not None and type is not None and type not in wanted and type != 'gameover':
+            return None
+        try:
+            data = loads(data)
+        except ValueError:
+            if type == 'gameover':
+                raise GameOver()
+            return None
+        if data['type'] == 'gameover':
+            raise GameOver(data=data)
+        return data
+
+    def transmit(self, request, now=None):
+        # (re)send a request and arm its timer from the current RTT estimate
+        now = time.monotonic() if now is None else now
+        self.sendM(request.payload)
+        if request.started is None:
+            request.started = now
+        request.sent_at = now
+        request.deadline = now + self.rtt.timeout(request.retries)
+        self.stats['sent'] += 1
+        if self.tracer:
+            self.tracer.count(self.river, 'sent')
+
+    def retransmit(self, request, now=None):
+        # resend after a timeout, fail the request once the retries are used up
+        if request.retries >= self.max_retries:
+            request.failed = True
+            self.stats['failures'] += 1
+            if self.tracer:
+                self.tracer.count(self.river, 'failures')
+            raise RequestTimeout([request])
+        request.retries += 1
+        self.stats['retransmissions'] += 1
+        if self.tracer:
+            self.tracer.count(self.river, 'retransmissions')
+        self.transmit(request, now)
+
+    def receive(self, request, data, now=None):
+        # record a reply; the first one of a request that was never resent is an RTT sample (Karn)
+        now = time.monotonic() if now is None else now
+        request.add(data)
+        if request.answered is None:
+            request.answered = now
+            request.rtt = now - request.sent_at
+            if request.retries == 0:
+                self.rtt.sample(request.rtt)
+        if request.done():
+            self.stats['requests'] += 1
+            if self.tracer:
+                self.tracer.request(self.river, request, now)
 
     def send(self, message, n=1):
-        # send a requisition and wait for response
-        resp_type = {'authreq': 'authresp', 'getcannons': 'cannons', 'getturn': 'state', 'shot': 'shotresp'}
-        resp = []
-        json_message = json.dumps(message)
-        try:
-            self.socket.send(json_message.encode(), (self.host, self.port))
-        except Exception as e:
-            print(e)
-            raise GameOver()
-        while len(resp) < n:
-            # wait for response
-            try:
-                data, _ = self.socket.recvfrom(1024)
-                data = json.loads(data.decode())
-                if data['type'] == 'gameover':
-                    raise GameOver()
-                if type == 'quit':
-                    return data
-                if data['type'] == resp_type[message['type']]:
-                    resp.append(data)
-            except socket.timeout:
-                if not len(resp):
-                    return self.send(message, n)
-                break
-            except json.decoder.JSONDecodeError as e:
-                if 'gameover' in str(data):
-                    raise GameOver()
-        if len(resp) == 1:
-            return resp[0]
-        return resp
+        # send a requisition and wait for its replies, resending with backoff
+        request = makeRequest(0, message, n)
+        self.transmit(request)
+        wanted = {request.expect}
+        while not request.done():
+            remaining = request.deadline - time.monotonic()
+            if remaining <= 0:
+                self.retransmit(request)
+                continue
+            self.socket.settimeout(remaining)
+            data = self.recvM(wanted)
+            if data is not None and request.accept(data):
+                self.receive(request, data)
+        return request.result()
 
     def close(self):
         if self.socket:
@@ -77,9 +295,22 @@ class ServerError(Exception):
         self.message = message
         super().__init__(self.message)
 
+class RequestTimeout(ServerError):
+    # a request still unanswered after the last retry, partial replies stay in the requests
+    def __init__(self, requests):
+        self.requests = requests
+        super().__init__('%d request(s) timed out' % len(requests))
+
 class GameOver(ServerError):
     # Game Over exception
     def __init__(self, message='GameOver', data=''):
         self.message = message
         self.data = data
-        super().__init__(self.message)
\ No newline at end of file
+        super().__init__(self.message)
+
+class AuthError(ServerError):
+    # authreq refused, e.g. a wrong GAS; data is the gameover message that refused it
+    def __init__(self, data=''):
+        self.data = data
+        description = data.get('description') if isinstance(data, dict) else data
+        super().__init__(f'Authentication failed: {description or "no reason given"}')
\ No newline at end of file
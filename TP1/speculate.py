@@ -0,0 +1,47 @@
+from board import *
+
+class Speculator:
+    # plans the next turn on a projection of the current one while its states are in flight,
+    # then patches the plan where the real board differs from the projection
+    def __init__(self, strategy):
+        self.strategy = strategy
+        self.projected = None
+        self.plan = None  # cannon -> ship id on the projected board
+        self.turns = 0
+        self.reused = 0      # turns whose plan needed no change
+        self.replanned = 0   # cannons planned again after the real states arrived
+
+    def predict(self, board, plan, index):
+        # board and plan {cannon: row} of the turn just played
+        self.projected = board.project(plan)
+        prediction = self.strategy.plan(self.projected, index)
+        self.plan = {cannon: self.projected.id[row] for cannon, row in prediction.items()}
+
+    def patch(self, board, index):
+        # final plan {cannon: row} for the real board, None without a prediction
+        if self.projected is None:
+            return None
+        self.turns += 1
+        real, guess = board.cellSignatures(), self.projected.cellSignatures()
+        changed = [cell for cell in real.keys() | guess.keys() if real.get(cell) != guess.get(cell)]
+        affected = {cannon for cell in changed for cannon in index.cannons.get(cell, ())}
+        rows = board.rowsById()
+        plan = {cannon: rows[id] for cannon, id in self.plan.items() if cannon not in affected and id in rows}
+        self.projected = self.plan = None
+        if not affected:
+            self.reused += 1
+            return plan
+        # plan the affected cannons alone, ships already shot by the kept plan count as damaged
+        shots = {}
+        for row in plan.values():
+            shots[row] = shots.get(row, 0) + 1
+        cells = {cell for cannon in affected for cell in index.cells[cannon]}
+        candidates = [row for row, cell in enumerate(zip(board.bridge, board.river))
+                      if cell in cells and board.remaining[row] > shots.get(row, 0)]
+        sub = board.select(candidates)
+        for i, row in enumerate(candidates):
+            sub.remaining[i] -= shots.get(row, 0)
+        subplan = self.strategy.plan(sub, CannonIndex(affected))
+        self.replanned += len(affected)
+        plan.update({cannon: candidates[i] for cannon, i in subplan.items()})
+        return plan
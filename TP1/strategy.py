@@ -0,0 +1,146 @@
+from board import *
+import time
+
+# per-turn decision budget in seconds and the largest search the exact solver tries
+BUDGET = 0.02
+MAX_EXACT_OPTIONS = 64
+
+class BudgetExceeded(Exception):
+    pass
+
+def targets(board, index):
+    # cannon -> rows of every ship it can reach, only cells holding ships are visited
+    options = {}
+    for cell, rows in board.shipsByCell().items():
+        for cannon in index.cannons.get(cell, ()):
+            options.setdefault(cannon, []).extend(rows)
+    return options
+
+def coverage(options):
+    # row -> cannons that can reach it
+    coverers = {}
+    for cannon, rows in options.items():
+        for row in rows:
+            coverers.setdefault(row, []).append(cannon)
+    return coverers
+
+def kills(plan, life):
+    shots = {}
+    for row in plan.values():
+        shots[row] = shots.get(row, 0) + 1
+    return sum(1 for row, n in shots.items() if n >= life[row])
+
+def fill(plan, options, life):
+    # cannons left idle hit the reachable ship that is closest to sinking and not sunk by the plan yet
+    shots = {}
+    for row in plan.values():
+        shots[row] = shots.get(row, 0) + 1
+    for cannon, rows in options.items():
+        if cannon in plan:
+            continue
+        alive = [row for row in rows if shots.get(row, 0) < life[row]]
+        if alive:
+            row = min(alive, key=lambda r: (life[r] - shots.get(r, 0), r))
+            plan[cannon] = row
+            shots[row] = shots.get(row, 0) + 1
+    return plan
+
+class Strategy:
+    # picks at most one target row per cannon for the turn
+    def __init__(self, budget=BUDGET):
+        self.budget = budget
+
+    def plan(self, board, index):
+        raise NotImplementedError
+
+class WeakestStrategy(Strategy):
+    # every cannon shoots the weakest ship in its reach, independently of the others
+    def plan(self, board, index):
+        life = board.remaining
+        options = {}
+        for cell, row in board.weakestByCell().items():
+            for cannon in index.cannons.get(cell, ()):
+                options.setdefault(cannon, []).append(row)
+        return {cannon: min(rows, key=life.__getitem__) for cannon, rows in options.items()}
+
+class GreedyStrategy(Strategy):
+    # cheapest kills first, spending the cannons with the fewest alternatives
+    def plan(self, board, index):
+        life = board.remaining
+        options = targets(board, index)
+        coverers = coverage(options)
+        free = set(options)
+        plan = {}
+        # ships needing fewer shots and reachable by fewer cannons go first,
+        # ships further down the river break ties since they leave sooner
+        order = sorted(coverers, key=lambda r: (life[r], len(coverers[r]), -board.bridge[r], r))
+        for row in order:
+            available = [c for c in coverers[row] if c in free]
+            if len(available) < life[row]:
+                continue
+            # lookahead: keep the cannons that could still kill something else
+            available.sort(key=lambda c: sum(1 for r in options[c] if r != row and life[r] <= len(coverers[r])))
+            for cannon in available[:life[row]]:
+                plan[cannon] = row
+                free.discard(cannon)
+        return fill(plan, options, life)
+
+class OptimalStrategy(GreedyStrategy):
+    # exact search for the most kills on small boards, greedy when it does not fit the budget
+    def plan(self, board, index):
+        deadline = time.monotonic() + self.budget
+        greedy = super().plan(board, index)
+        life = board.remaining
+        options = targets(board, index)
+        if sum(len(rows) for rows in options.values()) > MAX_EXACT_OPTIONS:
+            return greedy
+        coverers = coverage(options)
+        # a ship is worth chasing only if enough cannons reach it
+        cannons = sorted(options, key=lambda c: len(options[c]))
+        killable = {c: [r for r in options[c] if len(coverers[r]) >= life[r]] for c in cannons}
+        best = {'kills': kills(greedy, life), 'plan': None}
+        shots = {}
+        current = {}
+
+        def search(i, done):
+            if time.monotonic() > deadline:
+                raise BudgetExceeded()
+            if done + (len(cannons) - i) <= best['kills']:
+                return
+            if i == len(cannons):
+                best['kills'] = done
+                best['plan'] = dict(current)
+                return
+            cannon = cannons[i]
+            for row in killable[cannon]:
+                if shots.get(row, 0) >= life[row]:
+                    continue
+                shots[row] = shots.get(row, 0) + 1
+                current[cannon] = row
+                search(i + 1, done + (shots[row] == life[row]))
+                del current[cannon]
+                shots[row] -= 1
+            search(i + 1, done)
+
+        try:
+            search(0, 0)
+        except BudgetExceeded:
+            pass
+        if best['plan'] is None:
+            return greedy
+        # drop shots on ships the plan does not sink, fill() spreads them again
+        plan = best['plan']
+        sunk = {row for row in plan.values() if sum(1 for r in plan.values() if r == row) >= life[row]}
+        return fill({c: r for c, r in plan.items() if r in sunk}, options, life)
+
+STRATEGIES = {
+    'weakest': WeakestStrategy,
+    'greedy': GreedyStrategy,
+    'optimal': OptimalStrategy,
+}
+
+def makeStrategy(name='optimal', budget=BUDGET):
+    try:
+        return STRATEGIES[name](budget)
+    except KeyError:
+        raise ValueError('Invalid strategy: ' + str(name))
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from headless import playGame
+from record import Recorder, Replayer, readLog, OUT, IN
+import simulator
+
+class TestRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'game.log')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def record(self, compress=False):
+        # one short game against the simulator on a thread, logged to self.path
+        servers = simulator.RiverServers(simulator.RiverGame(seed=3, turns=12, cannons=6, spawn=0.6, gas=None))
+        thread = threading.Thread(target=servers.serveForever, daemon=True)
+        thread.start()
+        recorder = Recorder(self.path, compress=compress)
+        try:
+            played = playGame('127.0.0.1', servers.port, recorder=recorder)
+        finally:
+            recorder.close()
+            servers.close()
+            thread.join()
+        return played, recorder
+
+    def test_replay_plays_the_recorded_game(self):
+        for compress in (False, True):
+            with self.subTest(compress=compress):
+                (_, turns, _, result, _), recorder = self.record(compress)
+                records = list(readLog(self.path))
+                self.assertEqual(len(records), recorder.records)
+                self.assertEqual({direction for direction, *_ in records}, {OUT, IN})
+                replayer = Replayer(self.path)
+                _, replayed_turns, _, replayed, _ = playGame('replay', 0, socket_factory=replayer.socket)
+                self.assertEqual(replayed_turns, turns)
+                self.assertEqual(replayed, result)
+                os.remove(self.path)
+
+    def test_refuses_to_append_a_session(self):
+        self.record()
+        size = os.path.getsize(self.path)
+        with self.assertRaises(FileExistsError):
+            Recorder(self.path)
+        self.assertEqual(os.path.getsize(self.path), size)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import json
+import socket
+import unittest
+
+from socket_t import (Socket, Request, TurnRequest, ShotRequest, RttEstimator, MessageTemplate, RequestTimeout,
+                      peekType, shotKey, INITIAL_RTO, MIN_RTO, MAX_RTO)
+from engine import IOEngine
+
+def state(bridge, turn=0):
+    return {'type': 'state', 'auth': 'gas', 'turn': turn, 'bridge': bridge, 'ships': []}
+
+class Sink:
+    # a local UDP port the sockets under test send to, nothing is ever answered
+    def __enter__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        return self.sock.getsockname()[1]
+
+    def __exit__(self, *exc):
+        self.sock.close()
+
+class TestRttEstimator(unittest.TestCase):
+
+    def test_samples_update_the_rto(self):
+        rtt = RttEstimator()
+        self.assertEqual(rtt.rto, INITIAL_RTO)
+        rtt.sample(0.04)
+        self.assertAlmostEqual(rtt.srtt, 0.04)
+        self.assertAlmostEqual(rtt.rttvar, 0.02)
+        self.assertAlmostEqual(rtt.rto, 0.04 + 4 * 0.02)
+        rtt.sample(0.08)
+        self.assertAlmostEqual(rtt.rttvar, 0.75 * 0.02 + 0.25 * 0.04)
+        self.assertAlmostEqual(rtt.srtt, 0.875 * 0.04 + 0.125 * 0.08)
+        self.assertAlmostEqual(rtt.rto, rtt.srtt + 4 * rtt.rttvar)
+
+    def test_rto_bounds_and_backoff(self):
+        rtt = RttEstimator()
+        rtt.sample(0.0001)
+        self.assertEqual(rtt.rto, MIN_RTO)
+        self.assertEqual([rtt.timeout(i) for i in range(3)], [MIN_RTO, 2 * MIN_RTO, 4 * MIN_RTO])
+        self.assertEqual(rtt.timeout(30), MAX_RTO)
+        rtt.sample(10)
+        self.assertEqual(rtt.rto, MAX_RTO)
+
+class TestSocket(unittest.TestCase):
+
+    def test_retries_are_bounded(self):
+        with Sink() as port:
+            s = Socket('127.0.0.1', port, max_retries=2)
+            request = Request(0, {'type': 'getcannons', 'auth': 'gas'})
+            s.transmit(request, now=0.0)
+            self.assertAlmostEqual(request.deadline, INITIAL_RTO)
+            s.retransmit(request, now=1.0)
+            s.retransmit(request, now=2.0)
+            self.assertAlmostEqual(request.deadline, 2.0 + 4 * INITIAL_RTO)
+            with self.assertRaises(RequestTimeout) as cm:
+                s.retransmit(request, now=3.0)
+            self.assertEqual(cm.exception.requests, [request])
+            self.assertTrue(request.failed)
+            self.assertEqual(s.stats, {'requests': 0, 'sent': 3, 'retransmissions': 2, 'failures': 1})
+            s.close()
+
+    def test_retransmitted_replies_are_not_rtt_samples(self):
+        # Karn: the reply of a resent request may answer either copy
+        with Sink() as port:
+            s = Socket('127.0.0.1', port)
+            request = Request(0, {'type': 'getcannons', 'auth': 'gas'})
+            s.transmit(request, now=0.0)
+            s.retransmit(request, now=0.2)
+            s.receive(request, {'type': 'cannons', 'cannons': []}, now=0.25)
+            self.assertIsNone(s.rtt.srtt)
+            fresh = Request(0, {'type': 'getcannons', 'auth': 'gas'})
+            s.transmit(fresh, now=1.0)
+            s.receive(fresh, {'type': 'cannons', 'cannons': []}, now=1.05)
+            self.assertAlmostEqual(s.rtt.srtt, 0.05)
+            self.assertEqual(s.stats['requests'], 2)
+            s.close()
+
+class TestRequests(unittest.TestCase):
+
+    def test_turn_request_drops_duplicates_and_other_turns(self):
+        request = TurnRequest(0, {'type': 'getturn', 'auth': 'gas', 'turn': 3}, bridges=3)
+        self.assertTrue(request.accept(state(2, turn=3)))
+        request.add(state(2, turn=3))
+        self.assertFalse(request.accept(state(2, turn=3)))
+        self.assertFalse(request.accept(state(1, turn=2)))
+        self.assertEqual(request.missing(), [1, 3])
+        for bridge in (3, 1):
+            request.add(state(bridge, turn=3))
+        self.assertTrue(request.done())
+        self.assertEqual([s['bridge'] for s in request.result()], [1, 2, 3])
+
+    def test_peek_type(self):
+        data = b'{"auth":"gas","type":"shotresp","cannon":[1,2]}'
+        self.assertEqual(peekType(data), 'shotresp')
+        self.assertIsNone(peekType(data, 18))  # cut inside the value
+        self.assertIsNone(peekType(b'{"auth":"gas"}'))
+
+    def test_template_matches_json(self):
+        fields = {'auth': 'gas+token', 'type': 'shot'}
+        template = MessageTemplate(fields, ('cannon', 'id'))
+        for cannon, id in (([1, 2], 7), ([8, 4], 123456789)):
+            expected = json.dumps(template.message(cannon, id), separators=(',', ':')).encode()
+            self.assertEqual(template.encode(cannon, id), expected)
+            self.assertEqual(json.loads(template.encode(cannon, id)), dict(fields, cannon=cannon, id=id))
+        turn = MessageTemplate({'auth': 'gas', 'type': 'getturn'}, ('turn',))
+        self.assertEqual(json.loads(turn.encode(12)), {'auth': 'gas', 'type': 'getturn', 'turn': 12})
+
+class TestEngine(unittest.TestCase):
+
+    def test_shotresp_matched_by_key(self):
+        with Sink() as port:
+            s = Socket('127.0.0.1', port)
+            engine = IOEngine([s])
+            shots = [ShotRequest(0, {'type': 'shot', 'auth': 'gas', 'cannon': [1, 1], 'id': id}) for id in (5, 6)]
+            engine.submit(shots)
+            reply = {'type': 'shotresp', 'cannon': [1, 1], 'id': 6, 'status': 0}
+            self.assertEqual(shotKey(reply), ((1, 1), 6))
+            # the reply to the second shot skips the first one, a duplicate finds nothing
+            self.assertIs(engine.dispatch(0, reply, 0.0), shots[1])
+            self.assertIsNone(engine.dispatch(0, reply, 0.0))
+            self.assertIsNone(engine.dispatch(0, dict(reply, id=9), 0.0))
+            self.assertEqual(engine.pending[0], [shots[0]])
+            self.assertEqual(shots[1].result(), reply)
+            self.assertFalse(shots[0].replies)
+            engine.close()
+            s.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import itertools
+import random
+import unittest
+
+from board import Board, CannonIndex, cannonCells, BRIDGES, HULLS, HULL_LIFE
+from speculate import Speculator
+from strategy import targets, kills, GreedyStrategy, OptimalStrategy
+
+def state(bridge, ships):
+    return {'type': 'state', 'bridge': bridge, 'ships': ships}
+
+def ship(id, hull, hits=0):
+    return {'id': id, 'hull': hull, 'hits': hits}
+
+def randomGame(rng, ships=6, cannons=5):
+    # a few ships on random cells and cannons next to them, small enough to search exhaustively
+    rivers = [[] for _ in range(4)]
+    for id in range(ships):
+        hull = rng.choice(HULLS)
+        hits = rng.randrange(HULL_LIFE[hull])
+        rivers[rng.randrange(4)].append(state(rng.randint(1, 4), [ship(id, hull, hits)]))
+    positions = rng.sample([(x, y) for x in range(1, 5) for y in range(5)], cannons)
+    return Board.fromStates(rivers), CannonIndex(positions)
+
+def bruteForce(board, index):
+    # most ships sunk over every assignment of at most one reachable ship per cannon
+    options = targets(board, index)
+    cannons = list(options)
+    best = 0
+    for choice in itertools.product(*[options[c] + [None] for c in cannons]):
+        plan = {c: row for c, row in zip(cannons, choice) if row is not None}
+        best = max(best, kills(plan, board.remaining))
+    return best
+
+class TestBoard(unittest.TestCase):
+
+    def test_cannon_reach(self):
+        # a cannon at (x, y) covers rivers y and y+1 at bridge x, the outer ones a single river
+        self.assertEqual(cannonCells((3, 0)), [(3, 0)])
+        self.assertEqual(cannonCells((3, 2)), [(3, 1), (3, 2)])
+        self.assertEqual(cannonCells((3, 4)), [(3, 3)])
+        index = CannonIndex([[3, 1], [3, 2], [5, 2]])
+        self.assertEqual(index.cells[(3, 2)], ((3, 1), (3, 2)))
+        self.assertEqual(sorted(index.cannons[(3, 1)]), [(3, 1), (3, 2)])
+        self.assertEqual(index.cannons[(5, 2)], ((5, 2),))
+        self.assertNotIn((4, 1), index.cannons)
+
+    def test_targets_only_reachable_ships(self):
+        board = Board.fromStates([[state(2, [ship(1, 'frigate')])], [state(2, [ship(2, 'destroyer', 1)])], [], []])
+        options = targets(board, CannonIndex([[2, 1], [2, 0], [3, 1]]))
+        self.assertEqual(sorted(options[(2, 1)]), [0, 1])
+        self.assertEqual(options[(2, 0)], [0])
+        self.assertNotIn((3, 1), options)
+        self.assertEqual(list(board.remaining), [1, 1])
+
+    def test_project(self):
+        board = Board.fromStates([[state(3, [ship(1, 'frigate'), ship(2, 'battleship', 1)])],
+                                  [state(BRIDGES, [ship(3, 'destroyer')])], [], []])
+        projected = board.project({(3, 1): 0, (3, 0): 1})
+        # the frigate is sunk, the destroyer leaves the river, the battleship moves on damaged
+        self.assertEqual(list(projected.id), [2])
+        self.assertEqual(list(projected.bridge), [4])
+        self.assertEqual(list(projected.hits), [2])
+        self.assertEqual(list(projected.remaining), [1])
+        self.assertEqual(list(board.bridge), [3, 3, BRIDGES])
+
+class TestStrategy(unittest.TestCase):
+
+    def test_optimal_matches_brute_force(self):
+        rng = random.Random(0)
+        optimal, greedy = OptimalStrategy(budget=10), GreedyStrategy()
+        for _ in range(200):
+            board, index = randomGame(rng, ships=rng.randint(1, 7), cannons=rng.randint(1, 6))
+            best = bruteForce(board, index)
+            options = targets(board, index)
+            for strategy in (optimal, greedy):
+                plan = strategy.plan(board, index)
+                for cannon, row in plan.items():
+                    self.assertIn(row, options[cannon])
+                if strategy is optimal:
+                    self.assertEqual(kills(plan, board.remaining), best)
+                else:
+                    self.assertLessEqual(kills(plan, board.remaining), best)
+
+class TestSpeculator(unittest.TestCase):
+
+    def test_patch_reuses_an_exact_prediction(self):
+        rng = random.Random(1)
+        strategy = OptimalStrategy(budget=10)
+        for _ in range(50):
+            board, index = randomGame(rng)
+            plan = strategy.plan(board, index)
+            speculator = Speculator(strategy)
+            speculator.predict(board, plan, index)
+            predicted = dict(speculator.plan)
+            real = board.project(plan)
+            patched = speculator.patch(real, index)
+            self.assertEqual(speculator.reused, 1)
+            self.assertEqual({c: real.id[row] for c, row in patched.items()}, predicted)
+
+    def test_patch_replans_cannons_near_a_change(self):
+        board = Board.fromStates([[state(2, [ship(1, 'destroyer')])], [], [], []])
+        index = CannonIndex([[3, 1], [4, 1], [6, 3]])
+        strategy = OptimalStrategy(budget=10)
+        speculator = Speculator(strategy)
+        speculator.predict(board, {}, index)
+        # a frigate the projection could not know about shows up at the destroyer's next cell
+        rivers = [[state(3, [ship(1, 'destroyer'), ship(9, 'frigate')])], [], [], []]
+        real = Board.fromStates(rivers)
+        patched = speculator.patch(real, index)
+        self.assertEqual(speculator.reused, 0)
+        self.assertEqual(speculator.replanned, 1)
+        self.assertEqual(kills(patched, real.remaining), 1)
+        self.assertEqual(real.id[patched[(3, 1)]], 9)
+        self.assertIsNone(speculator.patch(real, index))
+
+if __name__ == '__main__':
+    unittest.main()
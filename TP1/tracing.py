@@ -0,0 +1,100 @@
+import json
+import time
+
+# Per-turn instrumentation of Game and Socket, exported as JSON lines or a Chrome trace
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class NullTracer:
+    # tracing disabled: every hook returns at once
+    enabled = False
+
+    def span(self, name, river=None):
+        return NULL_SPAN
+
+    def beginTurn(self, turn):
+        pass
+
+class Span:
+    def __init__(self, tracer, name, river):
+        self.tracer = tracer
+        self.name = name
+        self.river = river
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.tracer.phase(self.name, self.start, time.monotonic(), self.river)
+        return False
+
+class Tracer:
+    # records phase durations and message counters per turn and per river
+    enabled = True
+
+    def __init__(self):
+        self.origin = time.monotonic()
+        self.events = []  # (name, start, end, tid, args) for the Chrome trace
+        self.turns = []   # one record per turn for JSON lines
+        self.current = self.newTurn(None)
+
+    def newTurn(self, turn):
+        return {'turn': turn, 'phases': {}, 'rivers': {}}
+
+    def beginTurn(self, turn):
+        if self.current['phases'] or self.current['rivers']:
+            self.turns.append(self.current)
+        self.current = self.newTurn(turn)
+
+    def span(self, name, river=None):
+        return Span(self, name, river)
+
+    def phase(self, name, start, end, river=None):
+        phases = self.current['phases']
+        phases[name] = phases.get(name, 0.0) + (end - start)
+        self.events.append((name, start, end, 0 if river is None else river + 1, {'turn': self.current['turn']}))
+
+    def count(self, river, name, n=1):
+        counters = self.current['rivers'].setdefault(river + 1, {})
+        counters[name] = counters.get(name, 0) + n
+
+    def request(self, river, request, end):
+        # one finished request on a river, drawn on that river's track
+        args = {'turn': self.current['turn'], 'retries': request.retries, 'replies': len(request.replies)}
+        self.events.append((request.message['type'], request.started, end, river + 1, args))
+
+    def records(self):
+        return self.turns + ([self.current] if self.current['phases'] or self.current['rivers'] else [])
+
+    def writeJSONLines(self, path):
+        with open(path, 'w') as f:
+            for record in self.records():
+                phases = {name: round(d * 1000, 3) for name, d in record['phases'].items()}
+                f.write(json.dumps({'turn': record['turn'], 'phases_ms': phases, 'rivers': record['rivers']}) + '\n')
+
+    def writeChromeTrace(self, path):
+        # complete events ('X') in microseconds, track 0 is the game, tracks 1-4 are the rivers
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid,
+                   'args': {'name': 'game' if tid == 0 else f'river {tid}'}} for tid in range(5)]
+        for name, start, end, tid, args in self.events:
+            events.append({'name': name, 'ph': 'X', 'pid': 1, 'tid': tid, 'args': args,
+                           'ts': round((start - self.origin) * 1e6, 3), 'dur': round((end - start) * 1e6, 3)})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def write(self, path):
+        # .jsonl gets JSON lines, anything else a Chrome trace
+        if path.endswith('.jsonl'):
+            self.writeJSONLines(path)
+        else:
+            self.writeChromeTrace(path)
+
+NULL_TRACER = NullTracer()
@@ -0,0 +1,104 @@
+import time
+
+# Congestion windows and pacers for DCCNETConnection, in frames and bytes per second.
+# A window is asked how many frames may be in flight and told about every ACK and timeout;
+# a pacer is asked how long to wait before the next frame goes out.
+
+class FixedWindow:
+    # always the configured window, the behaviour without congestion control
+    def __init__(self, max_window=1):
+        self.max_window = max_window
+
+    def window(self):
+        return self.max_window
+
+    def on_ack(self):
+        pass
+
+    def on_timeout(self):
+        pass
+
+    def stats(self):
+        return {'cwnd': self.max_window}
+
+class AIMDWindow:
+    # slow start up to ssthresh, then one frame more per window acknowledged; a timeout
+    # halves ssthresh and restarts from one frame, as TCP does after a retransmission timeout
+    def __init__(self, max_window=1, initial=1):
+        self.max_window = max_window
+        self.cwnd = float(min(initial, max_window))
+        self.ssthresh = float(max_window)
+        self.reductions = 0
+
+    def window(self):
+        return max(1, min(self.max_window, int(self.cwnd)))
+
+    def on_ack(self):
+        if self.cwnd < self.ssthresh:
+            self.cwnd += 1  # slow start: doubles every round trip
+        else:
+            self.cwnd += 1 / self.cwnd  # congestion avoidance: one frame per round trip
+        self.cwnd = min(self.cwnd, float(self.max_window))
+
+    def on_timeout(self):
+        self.ssthresh = max(self.cwnd / 2, 1.0)
+        self.cwnd = 1.0
+        self.reductions += 1
+
+    def stats(self):
+        return {'cwnd': self.window(), 'ssthresh': self.ssthresh, 'reductions': self.reductions}
+
+CONGESTION = {
+    'fixed': FixedWindow,
+    'aimd': AIMDWindow,
+}
+
+def make_congestion(name='fixed', max_window=1):
+    try:
+        return CONGESTION[name](max_window)
+    except KeyError:
+        raise ValueError('Invalid congestion control: ' + str(name))
+
+class NoPacer:
+    def delay(self, size, now=None):
+        return 0.0
+
+    def consume(self, size, now=None):
+        pass
+
+    def stats(self):
+        return {}
+
+class TokenBucket:
+    # `rate` bytes per second on average, bursts of at most `burst` bytes
+    def __init__(self, rate, burst):
+        if rate <= 0 or burst <= 0:
+            raise ValueError('Rate and burst must be positive')
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.waited = 0.0  # seconds spent waiting for tokens
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, size, now=None):
+        # seconds until `size` bytes may be sent; a frame larger than the burst waits for a full bucket
+        self.refill(time.monotonic() if now is None else now)
+        missing = min(size, self.burst) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def consume(self, size, now=None):
+        self.refill(time.monotonic() if now is None else now)
+        self.tokens -= size  # may go negative for frames larger than the burst
+
+    def stats(self):
+        return {'rate': self.rate, 'paced_wait': self.waited}
+
+def make_pacer(rate=None, burst=None):
+    # no pacing without a rate; the burst defaults to 20 ms at that rate
+    if not rate:
+        return NoPacer()
+    return TokenBucket(rate, burst or rate / 50)
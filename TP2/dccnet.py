@@ -1,6 +1,10 @@
 import socket
 import struct
 import time
+from collections import OrderedDict, deque
+
+from congestion import make_congestion, make_pacer
+from timers import TimerWheel
 
 # Constants
 SYNC = 0xDCC023C2
@@ -8,6 +12,9 @@ HEADER_SIZE = 14  # SYNC (x2) + checksum + length + ID + flags
 MAX_PAYLOAD = 4096
 RETRANSMIT_TIMEOUT = 1.0 
 MAX_RETRIES = 16
+RECV_SIZE = 65536
+DEBUG = False  # print every frame encoded and decoded
+MAX_WINDOW = 128  # frames in flight at most, half the 1-byte ID space
 
 # Flags
 ACK_FLAG = 0x80
@@ -23,23 +30,14 @@ class DCCNETFrame:
 
 # Internet Checksum calculation (reference: https://tools.ietf.org/html/rfc1071)
 def internet_checksum(data):
-    checksum = 0
-    n = len(data)
-    i = 0
-
-    # Handle data in 16-bit chunks
-    while i < n - 1:
-        w = (data[i] << 8) | data[i + 1]  # Combine bytes into a 16-bit word
-        checksum += w
-        i += 2
-
-    # Handle the last byte if the data length is odd
-    if n % 2:
-        checksum += data[i] << 8  # Left-shift the last byte
-
-    # Fold 32-bit checksum to 16 bits
-    checksum = (checksum >> 16) + (checksum & 0xFFFF)
-    checksum += (checksum >> 16)  # Add carry if any
+    # The one's complement sum of the 16-bit words is congruent to the whole buffer, read as one
+    # big-endian number, modulo 0xFFFF (since 0x10000 = 1 mod 0xFFFF), so the word loop is done
+    # by int.from_bytes and a single modulo in C
+    if len(data) % 2:
+        data = bytes(data) + b'\x00'  # Pad the last byte
+    checksum = int.from_bytes(data, 'big') % 0xFFFF
+    if checksum == 0 and any(data):
+        checksum = 0xFFFF  # one's complement sum of non-zero words is never 0
 
     return ~checksum & 0xFFFF  # One's complement and mask to 16 bits
 
@@ -55,10 +53,11 @@ def encode_frame(frame):
     # 3. Repack the header with the correct checksum
     header = struct.pack('!IIHHBB', SYNC, SYNC, checksum, len(frame.payload), frame.id, frame.flags)
 
-    print(f"Header before checksum: {header_without_checksum!r}")
-    print(f"Payload: {frame.payload!r}")
-    print(f"Data to checksum: {data_to_checksum!r}")
-    print(f"Encoded Checksum: {checksum:04X}")
+    if DEBUG:
+        print(f"Header before checksum: {header_without_checksum!r}")
+        print(f"Payload: {frame.payload!r}")
+        print(f"Data to checksum: {data_to_checksum!r}")
+        print(f"Encoded Checksum: {checksum:04X}")
 
     return header + frame.payload
 
@@ -81,120 +80,320 @@ def decode_frame(data):
     # Now, extract the received checksum from the header
     received_checksum = struct.unpack('!H', data[8:10])[0]
 
-    # Calculate checksum on header (with 0 checksum) and payload
-    data_to_checksum = bytearray(data)  # Create a mutable copy
+    # Calculate checksum on header (with 0 checksum) and payload, frames after this one are left out
+    data_to_checksum = bytearray(data[:HEADER_SIZE + length])  # Create a mutable copy
     data_to_checksum[8:10] = b'\x00\x00'  # Zero out the checksum field
     calculated_checksum = internet_checksum(data_to_checksum)
 
-    print(f"Received header: {(sync1, sync2, received_checksum, length, id, flags)!r}")
-    print(f"Received payload: {payload!r}")
-    print(f"Decoded Checksum: {received_checksum:04X}, Calculated: {calculated_checksum:04X}")
+    if DEBUG:
+        print(f"Received header: {(sync1, sync2, received_checksum, length, id, flags)!r}")
+        print(f"Received payload: {payload!r}")
+        print(f"Decoded Checksum: {received_checksum:04X}, Calculated: {calculated_checksum:04X}")
 
     if calculated_checksum != received_checksum:
-        print(f"Checksum mismatch: Expected {received_checksum:04X}, Calculated {calculated_checksum:04X}")
+        if DEBUG:
+            print(f"Checksum mismatch: Expected {received_checksum:04X}, Calculated {calculated_checksum:04X}")
         raise ValueError("Checksum mismatch")
 
     return DCCNETFrame(id, flags, payload)
 
 class DCCNETConnection:
-    def __init__(self, host, port):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect((host, port))
+    def __init__(self, host, port, sock=None, window=1, congestion='fixed', rate=None, burst=None,
+                 timers=None, ack_delay=0.0):
+        """
+        Args:
+            host, port: server to connect to, unless `sock` is an already connected socket (e.g. from accept()).
+            window: most frames in flight, 1 is stop-and-wait.
+            congestion: 'fixed' keeps `window` frames in flight, 'aimd' grows towards it with slow start
+                and shrinks on timeouts; an object with the congestion.FixedWindow methods also works.
+            rate: cap on the bytes per second sent, None sends as fast as the window allows.
+            burst: bytes that may go out at once under `rate`.
+            timers: TimerWheel for the retransmission and delayed-ACK deadlines, may be shared by the
+                connections driven from one thread; each connection gets its own by default.
+            ack_delay: seconds an ACK may wait to be written together with later ACKs or data,
+                0 writes the ACKs of every read at once.
+        """
+        if not 1 <= window <= MAX_WINDOW:
+            raise ValueError(f"Window must be between 1 and {MAX_WINDOW}")
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.connect((host, port))
+        self.sock = sock
+        self.window = window  # 1 is stop-and-wait
+        self.congestion = make_congestion(congestion, window) if isinstance(congestion, str) else congestion
+        self.pacer = make_pacer(rate, burst)
+        self.stats = {'frames_sent': 0, 'bytes_sent': 0, 'retransmissions': 0, 'acks': 0, 'duplicate_acks': 0}
 
         self.current_id = 0  # ID of the next frame to send
         self.last_received_id = None  # ID of the last correctly received frame
         self.send_buffer = b''  # Buffer for incomplete messages
-        self.send_timer = None  # Timer for retransmissions
-        self.retry_count = 0
         self.last_sent_frame = None
-        
+        self.in_flight = OrderedDict()  # ID -> encoded frame waiting for its ACK, oldest first
+        self.timers = timers or TimerWheel()
+        self.retransmit_timer = None  # one deadline, for the oldest frame in flight
+        self.retry_count = 0  # times the oldest frame in flight was sent
+        self.ack_delay = ack_delay
+        self.pending_acks = []  # encoded ACKs not written yet
+        self.ack_timer = None
+        self.received = deque()  # Payloads received but not handed out yet
+        self.ended = False  # END received
+        self.peer_closed = False  # recv() returned EOF
+        self.closed = False
+        self.capture_tx = None  # objects with write(bytes) that get the raw stream, see dccnet_analyze
+        self.capture_rx = None
+
     def __enter__(self):
         return self
-    
+
     def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        # give the frames in flight a chance to be acknowledged, then close
+        if self.closed:
+            return
+        try:
+            self.wait_ack()
+            self.flush_acks()
+        except (OSError, ValueError):
+            pass
         self.sock.close()
-
-    def send_data(self, data):
-        frame = DCCNETFrame(self.current_id, 0, data)
+        self.closed = True
+        self.cancel_timers()
+
+    def cancel_timers(self):
+        # nothing of this connection may fire once it is closed, the wheel may outlive it
+        if self.retransmit_timer:
+            self.retransmit_timer.cancel()
+            self.retransmit_timer = None
+        if self.ack_timer:
+            self.ack_timer.cancel()
+            self.ack_timer = None
+
+    def send_data(self, data, flags=0):
+        # blocks while the window is full, then until the pacer lets the frame go
+        self.wait_window()
+        frame = DCCNETFrame(self.current_id, flags, data)
         self.last_sent_frame = encode_frame(frame)  # Store the last sent frame
-        self.sock.sendall(self.last_sent_frame)
+        self.wait_pacer(len(self.last_sent_frame))
+        self.in_flight[frame.id] = self.last_sent_frame
+        self.send_raw(self.take_acks() + self.last_sent_frame)  # pending ACKs go in the same write
+        self.current_id = (self.current_id + 1) % 256
+        self.stats['frames_sent'] += 1
+        self.stats['bytes_sent'] += len(self.last_sent_frame)
 
         # Start the retransmission timer if not already running
-        if not self.send_timer:
-            self.send_timer = time.time()
-            self.retry_count = 1
+        if len(self.in_flight) == 1:
+            self.arm_timer()
+
+    def arm_timer(self):
+        # (re)start the retransmission deadline of the oldest frame in flight
+        if self.retransmit_timer:
+            self.retransmit_timer.cancel()
+        self.retransmit_timer = self.timers.schedule(RETRANSMIT_TIMEOUT, self.handle_timeout)
+        self.retry_count = 1
+
+    def send_stream(self, buffers, end=True):
+        """
+        Sends every buffer of an iterable, split in frames of at most MAX_PAYLOAD bytes.
+
+        The iterable is only advanced when the window has room, so a slow peer blocks the producer
+        and at most `window` frames are held in memory. Returns once every frame is acknowledged.
+
+        Args:
+            buffers: iterable of bytes-like objects, e.g. file chunks or a generator.
+            end: send an END frame after the last buffer.
+        """
+        sent = 0
+        for buffer in buffers:
+            view = memoryview(buffer)
+            for i in range(0, len(view), MAX_PAYLOAD):
+                self.send_data(bytes(view[i:i + MAX_PAYLOAD]))
+                sent += 1
+        if end:
+            self.send_data(b'', END_FLAG)
+        self.wait_ack()
+        return sent
+
+    def wait_ack(self):
+        self.wait_window(0)
+
+    def wait_window(self, limit=None):
+        # pump the socket until at most `limit` frames are in flight, by default until one more fits
+        # in the congestion window (which may change while we wait)
+        while len(self.in_flight) > (self.congestion.window() - 1 if limit is None else limit):
+            if self.closed or self.peer_closed:
+                raise ConnectionResetError("Connection closed before the frame was acknowledged")
+            self.pump()
+
+    def wait_pacer(self, size):
+        # keep handling ACKs while the token bucket refills
+        delay = self.pacer.delay(size)
+        if delay > 0:
+            started = time.monotonic()
+            while delay > 0:
+                self.pump(delay)
+                delay = self.pacer.delay(size)
+            self.pacer.waited += time.monotonic() - started
+        self.pacer.consume(size)
+
+    def get_stats(self):
+        # counters, congestion window and pacing of this connection
+        return {**self.stats, 'in_flight': len(self.in_flight), **self.congestion.stats(), **self.pacer.stats()}
 
     def receive_data(self):
+        # next data payload, None once the peer sent END or closed the connection
+        while not self.received:
+            if self.ended or self.peer_closed or self.closed:
+                return None
+            self.pump()
+        return self.received.popleft()
+
+    def iter_payloads(self):
+        """
+        Yields data payloads until the peer sends END.
+
+        Raises:
+            ConnectionResetError: the peer sent RST.
+            ConnectionAbortedError: the connection closed before END.
+        """
         while True:
-            if len(self.send_buffer) < HEADER_SIZE:
+            payload = self.receive_data()
+            if payload is not None:
+                yield payload
+            elif self.ended:
+                return
+            else:
+                raise ConnectionAbortedError("Connection closed before END")
+
+    def pump(self, timeout=None):
+        # read from the socket once, waiting at most `timeout` seconds or until the next timer is due,
+        # handle every complete frame, then fire the timers that are due
+        due = self.timers.timeout()
+        if due is not None:
+            timeout = due if timeout is None else min(timeout, due)
+        self.sock.settimeout(timeout)
+        try:
+            data = self.sock.recv(RECV_SIZE)
+        except (socket.timeout, BlockingIOError):
+            data = None
+        if data is not None:
+            self.handle_data(data)
+        self.timers.advance()
+
+    def handle_data(self, data):
+        if not data:
+            self.peer_closed = True
+            return
+        if self.capture_rx:
+            self.capture_rx.write(data)
+        self.send_buffer += data
+        if DEBUG:
+            print(f"Received raw data: {self.send_buffer!r}")
+
+        while len(self.send_buffer) >= HEADER_SIZE:
+            frame = decode_frame(self.send_buffer)
+            if frame is None:
                 break  # Incomplete frame, wait for more data
-            try:
-                data = self.sock.recv(4096)
-                if not data:
-                    break
-                self.send_buffer += data
-            except socket.error as e:
-                print(f"Error receiving data: {e}")
-                break
-
-            while True:
-                print(f"Received raw data: {self.send_buffer!r}")
-
-                if len(self.send_buffer) < HEADER_SIZE:
-                    break  # Incomplete frame, wait for more data
-
-                frame = decode_frame(self.send_buffer)
-                if frame is None:
-                    break  # Incomplete frame, wait for more data
-
-                self.send_buffer = self.send_buffer[HEADER_SIZE + len(frame.payload):]
-
-                if self.is_valid_frame(frame):
-                    self.last_received_id = frame.id
-                    self.send_ack()
-                    if frame.flags & ACK_FLAG:
-                        self.current_id += 1
-                        if self.send_timer:
-                            self.send_timer = None
-                            self.retry_count = 0
-                    else:
-                        return frame.payload
+            self.send_buffer = self.send_buffer[HEADER_SIZE + len(frame.payload):]
+            self.handle_frame(frame)
 
-            # Handle timeout only after processing received data
-            self.handle_timeout() 
+        # the ACKs of everything read go out together, now or after ack_delay
+        if self.pending_acks and self.ack_timer is None:
+            if self.ack_delay:
+                self.ack_timer = self.timers.schedule(self.ack_delay, self.flush_acks)
+            else:
+                self.flush_acks()
+
+    def take_acks(self):
+        data = b''.join(self.pending_acks)
+        self.pending_acks.clear()
+        if self.ack_timer:
+            self.ack_timer.cancel()
+            self.ack_timer = None
+        return data
+
+    def flush_acks(self):
+        data = self.take_acks()
+        if data and not self.closed:
+            self.send_raw(data)
+
+    def send_raw(self, data):
+        if self.capture_tx:
+            self.capture_tx.write(data)
+        self.sock.sendall(data)
+
+    def handle_frame(self, frame):
+        if frame.flags & RST_FLAG:
+            self.is_valid_frame(frame)
+            self.closed = True
+            raise ConnectionResetError("Connection reset by peer")
+        if frame.flags & ACK_FLAG:
+            self.stats['acks'] += 1
+            if not self.is_valid_frame(frame):
+                self.stats['duplicate_acks'] += 1
+            else:
+                self.congestion.on_ack()
+                oldest = next(iter(self.in_flight))
+                del self.in_flight[frame.id]
+                if frame.id == oldest:
+                    # the timer follows the oldest frame still in flight
+                    if self.in_flight:
+                        self.arm_timer()
+                    else:
+                        self.retransmit_timer.cancel()
+                        self.retransmit_timer = None
+                        self.retry_count = 0
+            return
+        # a data frame is always acknowledged, a retransmission means our ACK was lost
+        self.send_ack(frame.id)
+        if not self.is_valid_frame(frame):
+            return
+        self.last_received_id = frame.id
+        if frame.payload:
+            self.received.append(frame.payload)
+        if frame.flags & END_FLAG:
+            self.ended = True
 
     def is_valid_frame(self, frame):
         # Frame validation logic
         if frame.flags & ACK_FLAG:
-            # Acknowledgement frame
-            return frame.id == self.current_id - 1  # ACK should match the previous frame ID
+            # Acknowledgement frame, must match a frame in flight
+            return frame.id in self.in_flight
         elif frame.flags & RST_FLAG:
             # Reset frame
             self.sock.close()
             return False
         else:
-            # Data frame
-            if self.last_received_id is not None and frame.id <= self.last_received_id:
-                # Ignore duplicate or out-of-order frames
-                return False
-            return True 
+            # Data frame, IDs up to a window behind the last one are retransmissions
+            return self.last_received_id is None or (self.last_received_id - frame.id) % 256 >= MAX_WINDOW
 
-    def send_ack(self):
-        ack_frame = DCCNETFrame(self.last_received_id, ACK_FLAG)
-        self.sock.sendall(encode_frame(ack_frame))
+    def send_ack(self, id=None):
+        # queued, written by handle_data, flush_acks or with the next data frame
+        ack_frame = DCCNETFrame(self.last_received_id if id is None else id, ACK_FLAG)
+        self.pending_acks.append(encode_frame(ack_frame))
 
     def handle_timeout(self):
-        if self.send_timer and time.time() - self.send_timer > RETRANSMIT_TIMEOUT:
-            if self.retry_count < MAX_RETRIES:
-                # Resend the unacknowledged frame
-                self.sock.sendall(self.last_sent_frame)
-                self.send_timer = time.time()
-                self.retry_count += 1
-            else:
-                # Handle unrecoverable error
-                self.send_rst()
-                self.sock.close()
+        # retransmission deadline of the oldest frame in flight: resend only that frame, the loss
+        # shrinks the congestion window so the newer frames wait for ACKs instead of being resent
+        if self.retransmit_timer:
+            self.retransmit_timer.cancel()  # no-op when called by the timer itself
+            self.retransmit_timer = None
+        if not self.in_flight or self.closed:
+            return
+        if self.retry_count < MAX_RETRIES:
+            self.congestion.on_timeout()
+            self.stats['retransmissions'] += 1
+            self.send_raw(self.take_acks() + next(iter(self.in_flight.values())))
+            self.retry_count += 1
+            self.retransmit_timer = self.timers.schedule(RETRANSMIT_TIMEOUT, self.handle_timeout)
+        else:
+            # Handle unrecoverable error
+            self.send_rst()
+            self.sock.close()
+            self.closed = True
+            self.cancel_timers()
 
     def send_rst(self):
-        rst_frame = DCCNETFrame(0, RST_FLAG)  # Use ID 0 for RST  
-        self.sock.sendall(encode_frame(rst_frame))
\ No newline at end of file
+        rst_frame = DCCNETFrame(0, RST_FLAG)  # Use ID 0 for RST
+        self.send_raw(encode_frame(rst_frame))
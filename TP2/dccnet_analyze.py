@@ -0,0 +1,218 @@
+import argparse
+import mmap
+import math
+import os
+import struct
+import time
+
+from dccnet import (SYNC, HEADER_SIZE, MAX_PAYLOAD, MAX_WINDOW, ACK_FLAG, END_FLAG, RST_FLAG,
+                    internet_checksum)
+
+# Offline analysis of captured DCCNET byte streams, one file per direction.
+# A capture is the raw stream exactly as it went over the wire; an optional sidecar file
+# <capture>.ts holds (timestamp, stream offset) records written as the bytes arrived.
+SYNC2 = struct.pack('!II', SYNC, SYNC)
+HEADER = struct.Struct('!IIHHBB')
+TIMESTAMP = struct.Struct('!dQ')  # seconds since the epoch, stream offset after the chunk
+MAX_SPANS = 10  # corrupt spans listed in the report, all of them are counted
+
+class Capture:
+    # write side: attach to a connection with capture(conn, prefix)
+    def __init__(self, path):
+        self.stream = open(path, 'wb')
+        self.timestamps = open(path + '.ts', 'wb')
+        self.offset = 0
+
+    def write(self, data):
+        self.stream.write(data)
+        self.offset += len(data)
+        self.timestamps.write(TIMESTAMP.pack(time.time(), self.offset))
+
+    def close(self):
+        self.stream.close()
+        self.timestamps.close()
+
+def capture(conn, prefix):
+    # record both directions of a connection to <prefix>.tx and <prefix>.rx
+    conn.capture_tx = Capture(prefix + '.tx')
+    conn.capture_rx = Capture(prefix + '.rx')
+    return conn.capture_tx, conn.capture_rx
+
+def timestamps(path):
+    # yields (offset, timestamp) from the sidecar, in stream order
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(TIMESTAMP.size * 4096)
+            if not chunk:
+                return
+            for timestamp, offset in TIMESTAMP.iter_unpack(chunk[:len(chunk) - len(chunk) % TIMESTAMP.size]):
+                yield offset, timestamp
+
+class Histogram:
+    # log-scaled buckets, constant memory whatever the number of samples
+    BUCKETS_PER_DECADE = 20
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        bucket = math.floor(math.log10(value) * self.BUCKETS_PER_DECADE) if value > 0 else None
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, p):
+        # upper bound of the bucket holding the p-th percentile
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets, key=lambda b: -math.inf if b is None else b):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return 0.0 if bucket is None else 10 ** ((bucket + 1) / self.BUCKETS_PER_DECADE)
+        return self.max
+
+class StreamStats:
+    def __init__(self):
+        self.bytes = 0
+        self.frames = 0
+        self.data_frames = 0
+        self.payload_bytes = 0
+        self.acks = 0
+        self.duplicate_acks = 0
+        self.ends = 0
+        self.resets = 0
+        self.retransmissions = 0
+        self.gaps = 0
+        self.missing_ids = 0
+        self.corrupt_spans = 0
+        self.corrupt_bytes = 0
+        self.checksum_errors = 0
+        self.spans = []  # first MAX_SPANS (offset, length, reason)
+        self.truncated = 0  # bytes of an incomplete frame at the end
+        self.timing = None  # Histogram of the gaps between frames, with timestamps
+
+    def corrupt(self, offset, length, reason):
+        self.corrupt_spans += 1
+        self.corrupt_bytes += length
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append((offset, length, reason))
+
+def frames(mm, stats):
+    """
+    Walks every frame of a mapped stream.
+
+    Bytes that are not a valid frame are reported as corrupt spans and skipped up to the next SYNC.
+
+    Yields:
+        (offset, end, id, flags) of every frame with a valid checksum.
+    """
+    size = len(mm)
+    offset = 0
+    while offset < size:
+        if mm[offset:offset + 8] != SYNC2:
+            start = mm.find(SYNC2, offset + 1)
+            end = size if start < 0 else start
+            stats.corrupt(offset, end - offset, 'no SYNC')
+            offset = end
+            continue
+        if size - offset < HEADER_SIZE:
+            stats.truncated = size - offset
+            return
+        _, _, _, length, id, flags = HEADER.unpack_from(mm, offset)
+        end = offset + HEADER_SIZE + length
+        if length > MAX_PAYLOAD:
+            reason = 'length %d' % length
+        elif end > size:
+            stats.truncated = size - offset
+            return
+        # a valid frame, checksum field included, sums to 0xFFFF: its checksum is 0
+        elif internet_checksum(mm[offset:end]) != 0:
+            stats.checksum_errors += 1
+            reason = 'checksum'
+        else:
+            yield offset, end, id, flags
+            offset = end
+            continue
+        # resynchronize on the next SYNC after this one
+        start = mm.find(SYNC2, offset + 1)
+        skip = (size if start < 0 else start) - offset
+        stats.corrupt(offset, skip, reason)
+        offset += skip
+
+def analyze(path, timestamps_path=None):
+    stats = StreamStats()
+    stats.bytes = os.path.getsize(path)
+    if stats.bytes == 0:
+        return stats
+    if timestamps_path is None and os.path.exists(path + '.ts'):
+        timestamps_path = path + '.ts'
+    clock = timestamps(timestamps_path) if timestamps_path else None
+    chunk_end, chunk_time = -1, None
+    last_time = None
+    if clock:
+        stats.timing = Histogram()
+    last_data = None
+    last_ack = None
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            mm.madvise(mmap.MADV_SEQUENTIAL)  # read ahead, pages already seen can be dropped
+        for offset, end, id, flags in frames(mm, stats):
+            stats.frames += 1
+            if clock:
+                # a frame is timed by the chunk that carried its last byte
+                while chunk_end < end:
+                    chunk_end, chunk_time = next(clock, (math.inf, chunk_time))
+                if last_time is not None and chunk_time is not None:
+                    stats.timing.add(chunk_time - last_time)
+                last_time = chunk_time
+            if flags & RST_FLAG:
+                stats.resets += 1
+            elif flags & ACK_FLAG:
+                stats.acks += 1
+                stats.duplicate_acks += id == last_ack
+                last_ack = id
+            else:
+                stats.data_frames += 1
+                stats.payload_bytes += end - offset - HEADER_SIZE
+                stats.ends += bool(flags & END_FLAG)
+                if last_data is not None:
+                    behind = (last_data - id) % 256
+                    if behind < MAX_WINDOW:
+                        stats.retransmissions += 1
+                        continue
+                    if behind != 255:
+                        stats.gaps += 1
+                        stats.missing_ids += (id - last_data - 1) % 256
+                last_data = id
+    return stats
+
+def report(path, stats, elapsed):
+    print(f"{path}: {stats.bytes} bytes analyzed in {elapsed:.3f}s "
+          f"({stats.bytes / max(elapsed, 1e-9) / 1e6:.1f} MB/s)")
+    print(f"  frames={stats.frames} data={stats.data_frames} ({stats.payload_bytes} payload bytes) "
+          f"acks={stats.acks} end={stats.ends} rst={stats.resets}")
+    print(f"  retransmissions={stats.retransmissions} duplicate_acks={stats.duplicate_acks} "
+          f"gaps={stats.gaps} (missing ids={stats.missing_ids})")
+    print(f"  corrupt spans={stats.corrupt_spans} ({stats.corrupt_bytes} bytes, "
+          f"{stats.checksum_errors} checksum errors) truncated tail={stats.truncated} bytes")
+    for offset, length, reason in stats.spans:
+        print(f"    offset {offset}: {length} bytes, {reason}")
+    timing = stats.timing
+    if timing and timing.count:
+        print(f"  inter-frame: mean={timing.total / timing.count * 1000:.3f}ms p50<={timing.percentile(50) * 1000:.3f}ms "
+              f"p95<={timing.percentile(95) * 1000:.3f}ms max={timing.max * 1000:.3f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze captured DCCNET byte streams")
+    parser.add_argument("captures", nargs="+", help="Captured streams, one file per direction")
+    parser.add_argument("--no-timing", action="store_true", help="Ignore the .ts sidecar files")
+    args = parser.parse_args()
+
+    for path in args.captures:
+        started = time.perf_counter()
+        stats = analyze(path, timestamps_path=None if not args.no_timing else '')
+        report(path, stats, time.perf_counter() - started)
@@ -1,21 +1,27 @@
+import argparse
 import hashlib
-import socket
 
 from dccnet import DCCNETConnection  # Import your DCCNET implementation
 
 SERVER_HOST = "rubick.snes.2advanced.dev"  # Replace with the actual server
 SERVER_PORT = 51555  # Replace with the actual port
 
-def md5_app(host, port):
-    with DCCNETConnection(host, port) as conn:
-        while True:
-            data = conn.receive_data()
-            if not data:  # End of transmission
-                break
+def md5_lines(payloads):
+    # MD5 of every line as a hex string with newline; a line may be split across payloads
+    pending = b''
+    for data in payloads:
+        *lines, pending = (pending + data).split(b'\n')
+        for line in lines:
+            yield hashlib.md5(line).hexdigest().encode('utf-8') + b'\n'
 
-            line = data.decode('utf-8').strip()  # Assuming lines are UTF-8 encoded
-            md5_digest = hashlib.md5(line.encode('utf-8')).hexdigest()
-            conn.send_data(md5_digest.encode('utf-8') + b'\n')  # Send MD5 as hex string with newline
+def md5_app(host, port, window=1):
+    with DCCNETConnection(host, port, window=window) as conn:
+        conn.send_stream(md5_lines(conn.iter_payloads()), end=False)
 
 if __name__ == "__main__":
-    md5_app(SERVER_HOST, SERVER_PORT)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="DCCNET MD5 Application")
+    parser.add_argument("host", nargs="?", default=SERVER_HOST)
+    parser.add_argument("port", nargs="?", type=int, default=SERVER_PORT)
+    parser.add_argument("-w", "--window", type=int, default=1, help="Frames in flight")
+    args = parser.parse_args()
+    md5_app(args.host, args.port, args.window)
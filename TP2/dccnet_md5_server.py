@@ -0,0 +1,154 @@
+import argparse
+import hashlib
+import random
+import socket
+import string
+import threading
+import time
+
+from dccnet import DCCNETConnection, END_FLAG, MAX_PAYLOAD
+
+# Local stand-in for the grading server of the MD5 application: streams lines over DCCNET,
+# checks every digest that comes back and measures throughput and digest latency.
+
+# frame_size 0 sends one line per frame, otherwise the text is cut every frame_size bytes
+WORKLOADS = {
+    'short': {'lines': 2000, 'min_length': 1, 'max_length': 40, 'frame_size': 0},
+    'long': {'lines': 200, 'min_length': 1000, 'max_length': MAX_PAYLOAD - 1, 'frame_size': 0},
+    'packed': {'lines': 5000, 'min_length': 1, 'max_length': 80, 'frame_size': MAX_PAYLOAD},
+    'split': {'lines': 1000, 'min_length': 20, 'max_length': 200, 'frame_size': 37},
+}
+ALPHABET = (string.ascii_letters + string.digits + string.punctuation + ' ').encode()
+
+def make_lines(count, min_length, max_length, seed=0):
+    rng = random.Random(seed)
+    return [bytes(rng.choices(ALPHABET, k=rng.randint(min_length, max_length))) for _ in range(count)]
+
+def make_frames(lines, frame_size=0):
+    """
+    Cuts the lines into frame payloads.
+
+    Returns:
+        (frames, ends): the payloads and, for every line, the index of the frame holding its '\\n'.
+    """
+    if not frame_size:
+        return [line + b'\n' for line in lines], list(range(len(lines)))
+    text = b''.join(line + b'\n' for line in lines)
+    frames = [text[i:i + frame_size] for i in range(0, len(text), frame_size)]
+    ends = []
+    offset = -1
+    for line in lines:
+        offset += len(line) + 1
+        ends.append(offset // frame_size)
+    return frames, ends
+
+class MD5Session:
+    # one client connection: send every frame, match the digests in order
+    def __init__(self, conn, lines, frame_size=0):
+        self.conn = conn
+        self.expected = [hashlib.md5(line).hexdigest().encode() for line in lines]
+        self.frames, ends = make_frames(lines, frame_size)
+        self.completes = {}  # frame index -> number of lines whose last byte it carries
+        for end in ends:
+            self.completes[end] = self.completes.get(end, 0) + 1
+        self.sent_at = []  # when each line was complete on the wire
+        self.latencies = []
+        self.mismatches = []
+        self.pending = b''
+        self.received = 0
+
+    def collect(self, payload):
+        now = time.perf_counter()
+        *digests, self.pending = (self.pending + payload).split(b'\n')
+        for digest in digests:
+            i = self.received
+            if i >= len(self.expected) or digest.strip() != self.expected[i]:
+                self.mismatches.append((i, digest))
+            if i < len(self.sent_at):
+                self.latencies.append(now - self.sent_at[i])
+            self.received += 1
+
+    def drain(self):
+        # digests that arrived while we were waiting for ACKs
+        while self.conn.received:
+            self.collect(self.conn.received.popleft())
+
+    def run(self):
+        started = time.perf_counter()
+        for i, frame in enumerate(self.frames):
+            self.conn.send_data(frame)
+            now = time.perf_counter()
+            self.sent_at.extend([now] * self.completes.get(i, 0))
+            self.drain()
+        self.conn.send_data(b'', END_FLAG)
+        self.drain()
+        while self.received < len(self.expected):
+            payload = self.conn.receive_data()
+            if payload is None:
+                break
+            self.collect(payload)
+        elapsed = time.perf_counter() - started
+        return {'lines': len(self.expected), 'frames': len(self.frames), 'digests': self.received,
+                'missing': max(0, len(self.expected) - self.received), 'mismatches': len(self.mismatches),
+                'elapsed': elapsed, 'latencies': self.latencies}
+
+def serve_once(listener, lines, frame_size=0):
+    # accept one client and play a workload with it
+    client, _ = listener.accept()
+    with DCCNETConnection(None, None, sock=client) as conn:
+        return MD5Session(conn, lines, frame_size).run()
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
+
+def report(name, result):
+    lines = result['lines']
+    latencies = result['latencies']
+    status = 'ok' if not result['missing'] and not result['mismatches'] else 'FAILED'
+    print(f"{name:<8} {status}: {lines} lines in {result['frames']} frames, {result['elapsed']:.3f}s "
+          f"({lines / result['elapsed']:.0f} lines/s), missing={result['missing']} mismatches={result['mismatches']}")
+    if latencies:
+        print(f"         digest latency p50={percentile(latencies, 50) * 1000:.3f}ms "
+              f"p95={percentile(latencies, 95) * 1000:.3f}ms max={max(latencies) * 1000:.3f}ms")
+
+def benchmark(workload, lines=None, seed=0):
+    # run the workload against dccnet_md5.md5_app on a loopback connection
+    from dccnet_md5 import md5_app
+
+    params = dict(WORKLOADS[workload])
+    if lines:
+        params['lines'] = lines
+    data = make_lines(params['lines'], params['min_length'], params['max_length'], seed)
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener:
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        client = threading.Thread(target=md5_app, args=listener.getsockname(), daemon=True)
+        client.start()
+        result = serve_once(listener, data, params['frame_size'])
+        client.join()
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local DCCNET MD5 server and line-throughput benchmark")
+    parser.add_argument("-w", "--workload", choices=sorted(WORKLOADS) + ['all'], default='all')
+    parser.add_argument("-n", "--lines", type=int, help="Number of lines, overrides the workload")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-s", "--server", type=int,
+                        help="Serve the workload to external clients on this port instead of benchmarking md5_app")
+    args = parser.parse_args()
+
+    names = sorted(WORKLOADS) if args.workload == 'all' else [args.workload]
+    if args.server:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind(('', args.server))
+            listener.listen(1)
+            print(f"Server listening on port {args.server}")
+            for name in names:
+                params = WORKLOADS[name]
+                data = make_lines(args.lines or params['lines'], params['min_length'], params['max_length'], args.seed)
+                report(name, serve_once(listener, data, params['frame_size']))
+    else:
+        for name in names:
+            report(name, benchmark(name, args.lines, args.seed))
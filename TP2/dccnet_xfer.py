@@ -3,10 +3,35 @@ import socket
 import os
 
 from dccnet import DCCNETConnection  # Import your DCCNET implementation
+from dccnet_analyze import capture
+from congestion import CONGESTION
 
 BUFFER_SIZE = 4096  # Size of data chunks for transfer
 
-def xfer_client(host_port, input_file, output_file):
+def read_chunks(path):
+    with open(path, 'rb') as f:
+        yield from iter(lambda: f.read(BUFFER_SIZE), b'')
+
+def transfer(conn, input_file, output_file, capture_prefix=None):
+    """
+    Sends the input file, then writes what the peer sends to the output file.
+
+    Data the peer sends while we are still sending is queued by the connection, so both
+    sides can run this at the same time. With capture_prefix the raw streams are saved to
+    <prefix>.tx and <prefix>.rx for dccnet_analyze.
+    """
+    captures = capture(conn, capture_prefix) if capture_prefix else ()
+    try:
+        conn.send_stream(read_chunks(input_file))  # ends with an END frame
+        with open(output_file, 'wb') as f:
+            for data in conn.iter_payloads():
+                f.write(data)
+        conn.close()
+    finally:
+        for c in captures:
+            c.close()
+
+def xfer_client(host_port, input_file, output_file, capture_prefix=None, **options):
     """
     Implements the client-side functionality for file transfer.
 
@@ -14,27 +39,18 @@ def xfer_client(host_port, input_file, output_file):
         host_port: IP address and port number of the server in format <IP>:<PORT>.
         input_file: Path to the file to be sent.
         output_file: Path to the file where received data will be stored.
-    """
-    host, port = host_port.split(':')
-    with DCCNETConnection(host, int(port)) as conn:
-        # Send file data
-        with open(input_file, 'rb') as f:
-            while True:
-                data = f.read(BUFFER_SIZE)
-                if not data:
-                    conn.send_data(b'')  # Send empty frame with END flag to signal end of file
-                    break
-                conn.send_data(data)
+        capture_prefix: Save the raw streams to <prefix>.tx and <prefix>.rx.
+        options: DCCNETConnection options (window, congestion, rate, burst).
 
-        # Receive file data
-        with open(output_file, 'wb') as f:
-            while True:
-                data = conn.receive_data()
-                if not data:
-                    break
-                f.write(data)
+    Returns:
+        The closed connection, for its stats.
+    """
+    host, port = host_port.rsplit(':', 1)
+    with DCCNETConnection(host, int(port), **options) as conn:
+        transfer(conn, input_file, output_file, capture_prefix)
+    return conn
 
-def xfer_server(port, input_file, output_file):
+def xfer_server(port, input_file, output_file, capture_prefix=None, **options):
     """
     Implements the server-side functionality for file transfer.
 
@@ -42,44 +58,43 @@ def xfer_server(port, input_file, output_file):
         port: Port number to listen on.
         input_file: Path to the file to be sent.
         output_file: Path to the file where received data will be stored.
+        capture_prefix: Save the raw streams to <prefix>.tx and <prefix>.rx.
+        options: DCCNETConnection options (window, congestion, rate, burst).
+
+    Returns:
+        The closed connection, for its stats.
     """
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
         sock.bind(('', port))  # Bind to all interfaces on the specified port
         sock.listen(1)
         print(f"Server listening on port {port}")
 
-        with sock.accept()[0] as conn:  # Accept a single connection
-            dccnet_conn = DCCNETConnection(conn.getsockname()[0], conn.getsockname()[1])
-
-            # Receive file data
-            with open(output_file, 'wb') as f:
-                while True:
-                    data = dccnet_conn.receive_data()
-                    if not data:
-                        break
-                    f.write(data)
-
-            # Send file data
-            with open(input_file, 'rb') as f:
-                while True:
-                    data = f.read(BUFFER_SIZE)
-                    if not data:
-                        dccnet_conn.send_data(b'')  # Send empty frame with END flag to signal end of file
-                        break
-                    dccnet_conn.send_data(data)
+        conn, _ = sock.accept()  # Accept a single connection
+        with DCCNETConnection(None, None, sock=conn, **options) as dccnet_conn:
+            transfer(dccnet_conn, input_file, output_file, capture_prefix)
+        return dccnet_conn
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="DCCNET File Transfer Application")
     parser.add_argument("-s", "--server", type=int, help="Run as server (specify port)")
     parser.add_argument("-c", "--client", type=str,
                         help="Run as client (specify host and port in format <IP>:<PORT>)")
+    parser.add_argument("-w", "--window", type=int, default=1, help="Frames in flight")
+    parser.add_argument("--congestion", choices=sorted(CONGESTION), default="fixed", help="Congestion control")
+    parser.add_argument("--rate", type=float, help="Cap on the bytes per second sent")
+    parser.add_argument("--stats", action="store_true", help="Print the connection stats at the end")
+    parser.add_argument("--capture", help="Save the raw streams to CAPTURE.tx and CAPTURE.rx")
     parser.add_argument("input", type=str, help="Input file path")
     parser.add_argument("output", type=str, help="Output file path")
     args = parser.parse_args()
 
+    options = {"window": args.window, "congestion": args.congestion, "rate": args.rate}
     if args.server:
-        xfer_server(args.server, args.input, args.output)
+        conn = xfer_server(args.server, args.input, args.output, args.capture, **options)
     elif args.client:
-        xfer_client(args.client, args.input, args.output)
+        conn = xfer_client(args.client, args.input, args.output, args.capture, **options)
     else:
-        parser.print_help()
\ No newline at end of file
+        parser.print_help()
+        conn = None
+    if conn and args.stats:
+        print(conn.get_stats())
\ No newline at end of file
@@ -3,7 +3,16 @@ import socket
 import struct
 from unittest.mock import patch, MagicMock
 import time
-from dccnet import DCCNETFrame, DCCNETConnection, encode_frame, decode_frame, internet_checksum
+import threading
+from dccnet import (DCCNETFrame, DCCNETConnection, encode_frame, decode_frame, internet_checksum, MAX_PAYLOAD,
+                    MAX_RETRIES, RETRANSMIT_TIMEOUT)
+from dccnet_md5_server import benchmark, make_frames
+from dccnet_analyze import analyze
+from congestion import AIMDWindow, TokenBucket
+from timers import TimerWheel
+import os
+import random
+import tempfile
 
 class TestDCCNET(unittest.TestCase):
 
@@ -39,14 +48,16 @@ class TestDCCNET(unittest.TestCase):
         conn = DCCNETConnection("rubick.snes.2advanced.dev", 51001)
         conn.send_data(b"test")
         data1 = conn.receive_data()
-        conn.send_data(b"test2")
+        conn.send_data(b"test2")  # waits for the ACK of the first frame
         data2 = conn.receive_data()
 
         self.assertEqual(data1, b"data1")
         self.assertEqual(data2, b"data2")
 
-        # Verify that the connection is closed after receiving the end of transmission
-        self.assertTrue(mock_sock.close.called)
+        # The last ACK arrives, then the peer closes the connection: no more data
+        self.assertIsNone(conn.receive_data())
+        self.assertTrue(conn.peer_closed)
+        self.assertFalse(conn.in_flight)
 
     @patch('socket.socket')
     def test_invalid_sync(self, mock_socket):
@@ -76,24 +87,30 @@ class TestDCCNET(unittest.TestCase):
         self.assertEqual(str(cm.exception), "Checksum mismatch")
 
     @patch('socket.socket')
-    @patch('time.time')
-    def test_retransmission(self, mock_time, mock_socket):
-        mock_time.side_effect = [0, 1.5, 2.5]
+    def test_retransmission(self, mock_socket):
+        now = [0.0]
+        wheel = TimerWheel(clock=lambda: now[0])
         mock_socket.return_value.recv.side_effect = [
-            encode_frame(DCCNETFrame(0, 0x80))  # Simulate ACK arrival
+            encode_frame(DCCNETFrame(0, 0x80)),  # Simulate ACK arrival
+            b""
         ]
 
-        conn = DCCNETConnection("localhost", 12345)
+        conn = DCCNETConnection("localhost", 12345, timers=wheel)
         conn.send_data(b"test")
 
-        # Allow time for potential retransmissions
-        time.sleep(0.1) 
+        # The retransmission timeout expires before anything arrives
+        now[0] += RETRANSMIT_TIMEOUT + 0.1
+        wheel.advance()
 
-        # Verify that send_data was called multiple times due to retransmissions
-        self.assertGreater(mock_socket.return_value.sendall.call_count, 1)
+        # Verify that the frame was sent again
+        sendall = mock_socket.return_value.sendall
+        self.assertEqual(sendall.call_count, 2)
+        self.assertEqual(sendall.call_args_list[0], sendall.call_args_list[1])
 
         # Simulate the eventual arrival of the ACK
-        conn.receive_data()
+        self.assertIsNone(conn.receive_data())
+        self.assertFalse(conn.in_flight)
+        self.assertEqual(wheel.pending, 0)
 
     @patch('socket.socket')
     def test_rst_handling(self, mock_socket):
@@ -122,8 +139,10 @@ class TestDCCNET(unittest.TestCase):
         data = conn.receive_data()
         self.assertEqual(data, b"data")
 
-        # Verify that the connection is closed after receiving the end of transmission
-        self.assertTrue(mock_socket.return_value.close.called)
+        # The ACK of our frame arrives, then the peer closes the connection
+        self.assertIsNone(conn.receive_data())
+        self.assertTrue(conn.peer_closed)
+        self.assertFalse(conn.in_flight)
 
     @patch('socket.socket')
     def test_send_rst(self, mock_socket):
@@ -132,6 +151,8 @@ class TestDCCNET(unittest.TestCase):
         conn = DCCNETConnection("localhost", 12345)
         conn.send_data(b"test")
 
+        # The last retransmission of the frame times out
+        conn.retry_count = MAX_RETRIES
         conn.handle_timeout()
 
         # Calculate the correct checksum for the RST frame
@@ -142,6 +163,307 @@ class TestDCCNET(unittest.TestCase):
         mock_socket.return_value.sendall.assert_called_with(expected_rst_frame) 
 
         self.assertTrue(mock_socket.return_value.close.called)
+        self.assertTrue(conn.closed)
+
+class TestChecksum(unittest.TestCase):
+
+    def reference(self, data):
+        # RFC 1071 word by word
+        checksum = 0
+        for i in range(0, len(data) - 1, 2):
+            checksum += (data[i] << 8) | data[i + 1]
+        if len(data) % 2:
+            checksum += data[-1] << 8
+        while checksum >> 16:
+            checksum = (checksum >> 16) + (checksum & 0xFFFF)
+        return ~checksum & 0xFFFF
+
+    def test_matches_reference(self):
+        rng = random.Random(0)
+        samples = [b"", b"\x00\x00", b"\xff\xff", b"\xff\xff\xff\xff", b"\x01"]
+        samples += [bytes(rng.choices(range(256), k=n)) for n in list(range(1, 64)) + [4096, 4097]]
+        for data in samples:
+            self.assertEqual(internet_checksum(data), self.reference(data), data)
+
+class TestAnalyzer(unittest.TestCase):
+
+    def analyze_bytes(self, data):
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        try:
+            return analyze(path)
+        finally:
+            os.remove(path)
+
+    def test_stream_anomalies(self):
+        frame = lambda id, flags=0, payload=b"data": encode_frame(DCCNETFrame(id, flags, payload))
+        corrupt = bytearray(frame(4))
+        corrupt[-1] ^= 0xFF
+        stream = (frame(0) + frame(1) + frame(1) + b"junk" + frame(3) + bytes(corrupt) + frame(4)
+                  + frame(0, 0x80, b"") + frame(5, 0x40, b"") + frame(6)[:16])
+        stats = self.analyze_bytes(stream)
+        self.assertEqual(stats.frames, 7)
+        self.assertEqual(stats.data_frames, 6)
+        self.assertEqual(stats.acks, 1)
+        self.assertEqual(stats.ends, 1)
+        self.assertEqual(stats.retransmissions, 1)
+        self.assertEqual((stats.gaps, stats.missing_ids), (1, 1))
+        self.assertEqual(stats.corrupt_spans, 2)
+        self.assertEqual(stats.checksum_errors, 1)
+        self.assertEqual(stats.corrupt_bytes, 4 + len(corrupt))
+        self.assertEqual(stats.truncated, 16)
+
+class TestStreaming(unittest.TestCase):
+
+    def pipe(self, window):
+        a, b = socket.socketpair()
+        return DCCNETConnection(None, None, sock=a, window=window), DCCNETConnection(None, None, sock=b)
+
+    def receive_all(self, conn, out):
+        out.extend(conn.iter_payloads())
+        conn.close()
+
+    def test_send_stream_bounded_window(self):
+        sender, receiver = self.pipe(window=4)
+        received = []
+        peer = threading.Thread(target=self.receive_all, args=(receiver, received))
+        peer.start()
+        in_flight = []
+
+        def produce():
+            for i in range(50):
+                in_flight.append(len(sender.in_flight))
+                yield b"%d," % i * 100
+
+        sender.send_stream(produce())
+        sender.close()
+        peer.join(5)
+        self.assertEqual(b"".join(received), b"".join(b"%d," % i * 100 for i in range(50)))
+        self.assertLessEqual(max(in_flight), 4)
+        self.assertEqual(len(sender.in_flight), 0)
+
+    def test_send_stream_splits_large_buffers(self):
+        sender, receiver = self.pipe(window=2)
+        received = []
+        peer = threading.Thread(target=self.receive_all, args=(receiver, received))
+        peer.start()
+        frames = sender.send_stream([b"x" * (2 * MAX_PAYLOAD + 1)])
+        sender.close()
+        peer.join(5)
+        self.assertEqual(frames, 3)
+        self.assertEqual([len(p) for p in received], [MAX_PAYLOAD, MAX_PAYLOAD, 1])
+
+    def test_iter_payloads_without_end(self):
+        a, b = socket.socketpair()
+        conn = DCCNETConnection(None, None, sock=a)
+        b.sendall(encode_frame(DCCNETFrame(0, 0, b"data")))
+        b.shutdown(socket.SHUT_WR)
+        payloads = conn.iter_payloads()
+        self.assertEqual(next(payloads), b"data")
+        with self.assertRaises(ConnectionAbortedError):
+            next(payloads)
+        a.close()
+        b.close()
+
+    def test_duplicate_frame_acked_not_delivered(self):
+        a, b = socket.socketpair()
+        conn = DCCNETConnection(None, None, sock=a)
+        frame = encode_frame(DCCNETFrame(0, 0, b"data"))
+        b.sendall(frame + frame + encode_frame(DCCNETFrame(1, 0x40)))
+        self.assertEqual(list(conn.iter_payloads()), [b"data"])
+        acks = b.recv(4096)
+        self.assertEqual(acks, encode_frame(DCCNETFrame(0, 0x80)) * 2 + encode_frame(DCCNETFrame(1, 0x80)))
+        a.close()
+        b.close()
+
+class TestCongestion(unittest.TestCase):
+
+    def test_aimd_slow_start_and_timeout(self):
+        cc = AIMDWindow(max_window=16)
+        self.assertEqual(cc.window(), 1)
+        for _ in range(7):
+            cc.on_ack()
+        self.assertEqual(cc.window(), 8)
+        cc.on_timeout()
+        self.assertEqual(cc.window(), 1)
+        self.assertEqual(cc.ssthresh, 4)
+        for _ in range(3):
+            cc.on_ack()
+        self.assertEqual(cc.window(), 4)
+        cc.on_ack()  # above ssthresh: additive increase
+        self.assertEqual(cc.window(), 4)
+        for _ in range(20):
+            cc.on_ack()
+        self.assertLessEqual(cc.window(), 16)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=1000, burst=100)
+        now = bucket.updated
+        self.assertEqual(bucket.delay(100, now), 0)
+        bucket.consume(100, now)
+        self.assertAlmostEqual(bucket.delay(50, now), 0.05)
+        self.assertAlmostEqual(bucket.delay(50, now + 0.05), 0)
+        # frames larger than the burst wait for a full bucket and leave a debt
+        bucket.consume(50, now + 0.05)
+        self.assertAlmostEqual(bucket.delay(400, now + 0.05), 0.1)
+
+    def test_paced_aimd_stream(self):
+        a, b = socket.socketpair()
+        sender = DCCNETConnection(None, None, sock=a, window=8, congestion="aimd", rate=200000, burst=MAX_PAYLOAD)
+        receiver = DCCNETConnection(None, None, sock=b)
+        received = []
+        peer = threading.Thread(target=lambda: received.extend(receiver.iter_payloads()))
+        peer.start()
+        started = time.monotonic()
+        sender.send_stream([b"y" * 20 * MAX_PAYLOAD])
+        elapsed = time.monotonic() - started
+        peer.join(5)
+        sender.close()
+        receiver.close()
+        stats = sender.get_stats()
+        self.assertEqual(b"".join(received), b"y" * 20 * MAX_PAYLOAD)
+        self.assertEqual(stats["frames_sent"], 21)
+        self.assertEqual(stats["cwnd"], 8)
+        self.assertGreater(stats["paced_wait"], 0)
+        self.assertGreater(elapsed, 19 * MAX_PAYLOAD / 200000 * 0.9)
+
+class TestTimers(unittest.TestCase):
+
+    def wheel(self, slots=8):
+        self.now = 100.0
+        return TimerWheel(tick=0.01, slots=slots, clock=lambda: self.now)
+
+    def test_fires_in_deadline_order_never_early(self):
+        wheel = self.wheel()
+        fired = []
+        wheel.schedule(0.05, fired.append, "b")
+        wheel.schedule(0.02, fired.append, "a")
+        wheel.schedule(0.5, fired.append, "c")  # several turns of an 8-slot wheel
+        self.now += 0.015
+        self.assertEqual(wheel.advance(), 0)
+        self.now += 0.04
+        self.assertEqual(wheel.advance(), 2)
+        self.assertEqual(fired, ["a", "b"])
+        self.now += 0.4
+        wheel.advance()
+        self.assertEqual(fired, ["a", "b"])
+        self.now += 0.05
+        wheel.advance()
+        self.assertEqual(fired, ["a", "b", "c"])
+        self.assertIsNone(wheel.timeout())
+
+    def test_cancel_and_timeout(self):
+        wheel = self.wheel()
+        fired = []
+        timer = wheel.schedule(0.03, fired.append, 1)
+        wheel.schedule(0.06, fired.append, 2)
+        self.assertAlmostEqual(wheel.timeout(), 0.03)
+        timer.cancel()
+        timer.cancel()
+        self.assertAlmostEqual(wheel.timeout(), 0.06)
+        self.now += 1
+        wheel.advance()
+        self.assertEqual(fired, [2])
+        self.assertEqual(wheel.pending, 0)
+
+    def test_timeout_after_cancelling_the_nearest_timer(self):
+        wheel = self.wheel()
+        first = wheel.schedule(0.02, lambda: None)
+        wheel.schedule(0.5, lambda: None)  # several turns of an 8-slot wheel away
+        for _ in range(1000):
+            wheel.schedule(0.03, lambda: None).cancel()
+        self.assertAlmostEqual(wheel.timeout(), 0.02)
+        first.cancel()
+        self.assertAlmostEqual(wheel.timeout(), 0.5)
+        self.assertLessEqual(len(wheel.ticks), 2 * len(wheel.counts) + 64)
+
+    @patch('dccnet.RETRANSMIT_TIMEOUT', 0.05)
+    def test_stalled_window_retransmits_oldest_frame_once_per_timeout(self):
+        # 8 frames in flight and no ACK: every timeout resends the oldest frame, not the window
+        for congestion in ('fixed', 'aimd'):
+            with self.subTest(congestion=congestion):
+                wheel = self.wheel(slots=64)
+                a, b = socket.socketpair()
+                conn = DCCNETConnection(None, None, sock=a, window=8, congestion=congestion, timers=wheel)
+                conn.congestion = AIMDWindow(8, initial=8) if congestion == 'aimd' else conn.congestion
+                for i in range(8):
+                    conn.send_data(b"frame%d" % i)
+                oldest = encode_frame(DCCNETFrame(0, 0, b"frame0"))
+                b.settimeout(1)
+                sent = b""
+                while len(sent) < 8 * len(oldest):
+                    sent += b.recv(4096)
+                self.assertEqual(wheel.pending, 1)
+                b.settimeout(0)
+                for rto in range(1, 4):
+                    self.now += 0.06
+                    wheel.advance()
+                    self.assertEqual(b.recv(4096), oldest)
+                    self.assertEqual(conn.stats["retransmissions"], rto)
+                    self.assertEqual(wheel.pending, 1)
+                # the ACK of the oldest frame moves the deadline to the next one
+                b.sendall(encode_frame(DCCNETFrame(0, 0x80)))
+                conn.pump(1)
+                self.assertEqual(conn.retry_count, 1)
+                self.now += 0.06
+                wheel.advance()
+                self.assertEqual(b.recv(4096), encode_frame(DCCNETFrame(1, 0, b"frame1")))
+                conn.cancel_timers()
+                a.close()
+                b.close()
+
+    @patch('dccnet.RETRANSMIT_TIMEOUT', 0.05)
+    def test_shared_wheel_retransmits_while_blocked(self):
+        # conn1 never gets an ACK; pumping conn2 fires conn1's timer on time
+        wheel = TimerWheel()
+        a1, b1 = socket.socketpair()
+        a2, b2 = socket.socketpair()
+        conn1 = DCCNETConnection(None, None, sock=a1, timers=wheel)
+        conn2 = DCCNETConnection(None, None, sock=a2, timers=wheel)
+        conn1.send_data(b"lost")
+        frame = b1.recv(4096)
+        started = time.monotonic()
+        conn2.pump(0.2)
+        self.assertLess(time.monotonic() - started, 0.15)
+        b1.settimeout(0)
+        self.assertEqual(b1.recv(4096), frame)
+        self.assertEqual(conn1.stats["retransmissions"], 1)
+        b1.sendall(encode_frame(DCCNETFrame(0, 0x80)))
+        conn1.wait_ack()
+        self.assertEqual(wheel.pending, 0)
+        for s in (a1, b1, a2, b2):
+            s.close()
+
+    def test_delayed_acks_coalesce(self):
+        a, b = socket.socketpair()
+        conn = DCCNETConnection(None, None, sock=a, ack_delay=0.05)
+        b.sendall(encode_frame(DCCNETFrame(0, 0, b"x")))
+        conn.pump()
+        b.sendall(encode_frame(DCCNETFrame(1, 0, b"y")))
+        conn.pump()
+        b.settimeout(0)
+        with self.assertRaises(BlockingIOError):
+            b.recv(4096)
+        while conn.pending_acks:
+            conn.pump(0.1)
+        b.settimeout(1)
+        self.assertEqual(b.recv(4096), encode_frame(DCCNETFrame(0, 0x80)) + encode_frame(DCCNETFrame(1, 0x80)))
+        a.close()
+        b.close()
+
+class TestMD5Server(unittest.TestCase):
+
+    def test_make_frames_split(self):
+        frames, ends = make_frames([b"abc", b"defgh", b"i"], 4)
+        self.assertEqual(frames, [b"abc\n", b"defg", b"h\ni\n"])
+        self.assertEqual(ends, [0, 2, 2])
+
+    def test_md5_app_workloads(self):
+        for workload in ("short", "packed", "split"):
+            result = benchmark(workload, lines=100)
+            self.assertEqual(result["digests"], 100, workload)
+            self.assertEqual(result["mismatches"], 0, workload)
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
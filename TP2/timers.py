@@ -0,0 +1,108 @@
+import heapq
+import math
+import time
+
+# Hashed timer wheel on the monotonic clock for retransmission and delayed-ACK deadlines.
+# Cancelling is O(1). The ticks holding timers are also kept in a heap, emptied lazily: scheduling
+# is O(log k) in the number of distinct ticks pending, timeout() reads the nearest one in amortized
+# O(1) and advance() visits only the ticks that are due, never the empty slots between them.
+# A wheel may be shared by every connection driven from one thread: whichever connection
+# advances it fires the timers of all of them.
+TICK = 0.005  # seconds per slot, timers fire at most one tick late
+SLOTS = 512  # one turn of the wheel covers SLOTS * TICK seconds, longer timers wait whole turns
+
+class Timer:
+    __slots__ = ('deadline', 'expires', 'callback', 'args', 'wheel')
+
+    def __init__(self, deadline, expires, callback, args, wheel):
+        self.deadline = deadline
+        self.expires = expires  # tick at which the timer fires
+        self.callback = callback
+        self.args = args
+        self.wheel = wheel
+
+    def cancel(self):
+        if self.wheel:
+            self.wheel.cancel(self)
+
+    @property
+    def active(self):
+        return self.wheel is not None
+
+class TimerWheel:
+    def __init__(self, tick=TICK, slots=SLOTS, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self.slots = [set() for _ in range(slots)]
+        self.current = math.floor(clock() / tick)  # last tick processed
+        self.counts = {}  # tick -> timers pending in it
+        self.ticks = []  # heap of ticks, those no longer in counts are dropped when they surface
+        self.pending = 0
+        self.fired = 0
+
+    def schedule(self, delay, callback, *args):
+        # call callback(*args) `delay` seconds from now, returns the Timer to cancel it
+        deadline = self.clock() + max(0.0, delay)
+        # never in a tick already processed, and never before the deadline
+        expires = max(self.current + 1, math.ceil(deadline / self.tick))
+        timer = Timer(deadline, expires, callback, args, self)
+        self.slots[expires % len(self.slots)].add(timer)
+        if expires not in self.counts:
+            self.counts[expires] = 0
+            heapq.heappush(self.ticks, expires)
+        self.counts[expires] += 1
+        self.pending += 1
+        return timer
+
+    def cancel(self, timer):
+        self.slots[timer.expires % len(self.slots)].discard(timer)
+        timer.wheel = None
+        self.pending -= 1
+        self.counts[timer.expires] -= 1
+        if not self.counts[timer.expires]:
+            del self.counts[timer.expires]
+            if len(self.ticks) > 2 * len(self.counts) + 64:
+                # deadlines re-armed over and over leave many dropped ticks behind, rebuild the heap
+                self.ticks = list(self.counts)
+                heapq.heapify(self.ticks)
+
+    def nearest_tick(self):
+        # earliest tick with a timer pending, None when there is none
+        ticks = self.ticks
+        while ticks and ticks[0] not in self.counts:
+            heapq.heappop(ticks)
+        return ticks[0] if ticks else None
+
+    def advance(self, now=None):
+        # fire every timer whose tick has passed, in deadline order; returns how many fired
+        target = math.floor((self.clock() if now is None else now) / self.tick)
+        due = []
+        n = len(self.slots)
+        while True:
+            t = self.nearest_tick()
+            if t is None or t > target:
+                break
+            heapq.heappop(self.ticks)
+            del self.counts[t]
+            # the slot may also hold timers of later turns of the wheel
+            slot = self.slots[t % n]
+            ready = [timer for timer in slot if timer.expires == t]
+            for timer in ready:
+                slot.discard(timer)
+                timer.wheel = None
+            due.extend(ready)
+        self.current = max(self.current, target)
+        self.pending -= len(due)
+        due.sort(key=lambda timer: timer.deadline)
+        for timer in due:
+            timer.callback(*timer.args)
+        self.fired += len(due)
+        return len(due)
+
+    def timeout(self, now=None):
+        # seconds until the next timer is due, None when nothing is scheduled
+        t = self.nearest_tick()
+        if t is None:
+            return None
+        now = self.clock() if now is None else now
+        return max(0.0, t * self.tick - now)
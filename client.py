@@ -1,6 +1,9 @@
 import sys
-import socket
 import struct
+import time
+
+# the UDP engine is shared with the TP1 load generator
+from TP1.auth.udp import UDPEngine
 
 # Constants for message types
 INDIVIDUAL_TOKEN_REQUEST = 1
@@ -11,6 +14,7 @@ GROUP_TOKEN_REQUEST = 5
 GROUP_TOKEN_RESPONSE = 6
 GROUP_TOKEN_VALIDATION = 7
 GROUP_TOKEN_STATUS = 8
+ERROR_MESSAGE = 256
 
 # Error codes
 INVALID_MESSAGE_CODE = 1
@@ -19,66 +23,120 @@ INVALID_PARAMETER = 3
 INVALID_SINGLE_TOKEN = 4
 ASCII_DECODE_ERROR = 5
 
-def send_message(host, port, message):
-    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-        s.sendto(message, (host, port))
-        response, _ = s.recvfrom(1024)
-    return response
+def pack_sas(sas):
+    id, nonce, token = sas.split(":")
+    return struct.pack("!12sI64s", id.encode("ascii"), int(nonce), token.encode("ascii"))
+
+def unpack_sas(data):
+    id, nonce, token = struct.unpack("!12sI64s", data)
+    return f"{id.decode('ascii').rstrip(chr(0))}:{nonce}:{token.decode('ascii')}"
 
 def individual_token_request(id, nonce):
-    message = struct.pack("!H12sI", INDIVIDUAL_TOKEN_REQUEST, id.encode("ascii"), nonce)
-    return send_message(sys.argv[1], int(sys.argv[2]), message)
+    return struct.pack("!H12sI", INDIVIDUAL_TOKEN_REQUEST, id.encode("ascii"), int(nonce))
 
 def individual_token_validation(sas):
-    id, nonce, token = sas.split(":")
-    message = struct.pack("!H12sI64s", INDIVIDUAL_TOKEN_VALIDATION, id.encode("ascii"), int(nonce), bytes.fromhex(token))
-    return send_message(sys.argv[1], int(sys.argv[2]), message)
+    return struct.pack("!H", INDIVIDUAL_TOKEN_VALIDATION) + pack_sas(sas)
 
 def group_token_request(n, *sas_list):
-    sas_bytes = b"".join(struct.pack("!12sI64s", id.encode("ascii"), int(nonce), bytes.fromhex(token)) for sas in sas_list)
-    message = struct.pack("!H2s", GROUP_TOKEN_REQUEST, struct.pack("!H", n)) + sas_bytes
-    return send_message(sys.argv[1], int(sys.argv[2]), message)
+    sas_bytes = b"".join(pack_sas(sas) for sas in sas_list)
+    return struct.pack("!HH", GROUP_TOKEN_REQUEST, int(n)) + sas_bytes
 
 def group_token_validation(gas):
-    sas_tokens = gas.split("+")
-    n = len(sas_tokens)
-    sas_bytes = b"".join(struct.pack("!12sI64s", *sas.split(":")) for sas in sas_tokens)
-    message = struct.pack("!H2s", GROUP_TOKEN_VALIDATION, struct.pack("!H", n)) + sas_bytes
-    return send_message(sys.argv[1], int(sys.argv[2]), message)
+    *sas_tokens, token = gas.split("+")
+    sas_bytes = b"".join(pack_sas(sas) for sas in sas_tokens)
+    return struct.pack("!HH", GROUP_TOKEN_VALIDATION, len(sas_tokens)) + sas_bytes + token.encode("ascii")
+
+def build_request(args):
+    # build the request for a command line like ['itv', 'id:nonce:token']
+    command = args[0] if args else None
+    if command == "itr" and len(args) == 3:
+        return individual_token_request(args[1], args[2])
+    elif command == "itv" and len(args) == 2:
+        return individual_token_validation(args[1])
+    elif command == "gtr" and len(args) >= 3:
+        return group_token_request(args[1], *args[2:])
+    elif command == "gtv" and len(args) == 2:
+        return group_token_validation(args[1])
+    raise ValueError("Invalid command or incorrect number of arguments")
 
 def parse_response(response):
     message_type, = struct.unpack("!H", response[:2])
     if message_type == INDIVIDUAL_TOKEN_RESPONSE:
-        id, nonce, token = struct.unpack("!12sI64s", response[2:])
-        return f"{id.decode('ascii')}:{nonce}:{token.hex()}"
+        return unpack_sas(response[2:])
+    elif message_type == GROUP_TOKEN_RESPONSE:
+        sas_bytes, token = response[4:-64], response[-64:]
+        sas_list = [unpack_sas(sas_bytes[i:i + 80]) for i in range(0, len(sas_bytes), 80)]
+        return "+".join(sas_list + [token.decode("ascii")])
     elif message_type == INDIVIDUAL_TOKEN_STATUS or message_type == GROUP_TOKEN_STATUS:
-        id, nonce, token, status = struct.unpack("!12sI64sB", response[2:])
-        return status
+        return response[-1]
+    elif message_type == ERROR_MESSAGE:
+        error_code, = struct.unpack("!H", response[2:4])
+        return f"error {error_code}"
     else:
         return None  # Handle other response types as needed
 
+def format_result(request):
+    if request.response is not None:
+        return parse_response(request.response)
+    if request.error is not None:
+        return f"error {request.error}"
+    if request.suspect is not None:
+        return f"error {request.suspect} (unattributed)"
+    return "timeout"
+
+def read_batch(path):
+    # one command per line, e.g. "itv id:nonce:token"; blank lines and comments are skipped
+    # yields (line number, request), the request is the exception of a malformed line
+    with (sys.stdin if path == "-" else open(path)) as f:
+        for lineno, line in enumerate(f, 1):
+            args = line.split()
+            if not args or args[0].startswith("#"):
+                continue
+            try:
+                yield lineno, build_request(args)
+            except (ValueError, struct.error) as e:
+                yield lineno, e
+
+def run_batch(engine, path):
+    # prints "line<TAB>result" as every request completes, so results come out of order
+    lines = []  # line number of every request sent, by engine index
+    count = 0
+
+    def requests():
+        nonlocal count
+        for lineno, message in read_batch(path):
+            count += 1
+            if isinstance(message, Exception):
+                print(f"{lineno}\terror: {message}", flush=True)
+                continue
+            lines.append(lineno)
+            yield message
+
+    started = time.monotonic()
+    for request in engine.run(requests()):
+        print(f"{lines[request.index]}\t{format_result(request)}", flush=True)
+    elapsed = time.monotonic() - started
+    print(f"{count} requests in {elapsed:.3f}s, {engine.retransmitted} retransmissions", file=sys.stderr)
+
 def main():
     if len(sys.argv) < 4:
         print("Usage: ./client <host> <port> <command>")
+        print("       ./client <host> <port> batch <file|->")
         sys.exit(1)
 
-    command = sys.argv[3]
-
-    if command == "itr" and len(sys.argv) == 6:
-        response = individual_token_request(sys.argv[4], int(sys.argv[5]))
-        print(parse_response(response))
-    elif command == "itv" and len(sys.argv) == 5:
-        response = individual_token_validation(sys.argv[4])
-        print(parse_response(response))
-    elif command == "gtr" and len(sys.argv) >= 5:
-        response = group_token_request(int(sys.argv[4]), *sys.argv[5:])
-        print(parse_response(response))
-    elif command == "gtv" and len(sys.argv) == 5:
-        response = group_token_validation(sys.argv[4])
-        print(parse_response(response))
-    else:
-        print("Invalid command or incorrect number of arguments")
-        sys.exit(1)
+    engine = UDPEngine(sys.argv[1], int(sys.argv[2]))
+    try:
+        if sys.argv[3] == "batch" and len(sys.argv) == 5:
+            run_batch(engine, sys.argv[4])
+            return
+        try:
+            message = build_request(sys.argv[3:])
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        print(format_result(engine.request(message)))
+    finally:
+        engine.close()
 
 if __name__ == "__main__":
     main()